@@ -0,0 +1,83 @@
+# activity.py
+import asyncio
+import datetime
+import logging
+from typing import Callable, Optional
+
+from cachetools import TTLCache
+
+from config import LAST_ACTIVE_UPDATE_MIN, ACTIVITY_FLUSH_SEC, ACTIVITY_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """Буфер записи users.last_active.
+
+    touch() вызывается middleware на каждый апдейт и только запоминает время
+    в памяти. Раз в ACTIVITY_FLUSH_SEC накопленное уходит в базу одним UPDATE
+    по UNNEST, причём строка не трогается, если сохранённое значение моложе
+    LAST_ACTIVE_UPDATE_MIN. Пользователь, записанный недавно, второй раз
+    в буфер не попадает, так что last_active отстаёт от реального не больше
+    чем на LAST_ACTIVE_UPDATE_MIN + ACTIVITY_FLUSH_SEC.
+    """
+
+    def __init__(self, db, granularity_min: float = LAST_ACTIVE_UPDATE_MIN, flush_sec: float = ACTIVITY_FLUSH_SEC,
+                 on_touch: Optional[Callable[[int], None]] = None):
+        self.db = db
+        self.granularity_min = granularity_min
+        self.flush_sec = flush_sec
+        self.on_touch = on_touch
+        self._dirty = {}  # user_id -> время активности
+        # записанные недавно: пока ключ жив, повторная запись не нужна
+        self._written = TTLCache(maxsize=ACTIVITY_CACHE_SIZE, ttl=granularity_min * 60)
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def touch(self, user_id: int):
+        if user_id in self._written:
+            return
+        self._dirty[user_id] = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        if self.on_touch:
+            self.on_touch(user_id)
+
+    def start(self):
+        self._stop.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Останавливает фоновый сброс и записывает остаток буфера"""
+        self._stop.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _loop(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.flush_sec)
+            except asyncio.TimeoutError:
+                pass
+            if self._stop.is_set():
+                break
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("activity flush failed")
+
+    async def flush(self) -> int:
+        if not self._dirty:
+            return 0
+        batch, self._dirty = self._dirty, {}
+        try:
+            updated = await self.db.touch_users(list(batch), list(batch.values()), self.granularity_min)
+        except Exception:
+            # вернуть в буфер, не затирая более свежие отметки
+            for user_id, ts in batch.items():
+                self._dirty.setdefault(user_id, ts)
+            raise
+        for user_id in batch:
+            self._written[user_id] = True
+        logger.debug(f"last_active: {updated} из {len(batch)} записано")
+        return updated
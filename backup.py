@@ -0,0 +1,286 @@
+# backup.py
+"""Потоковые бэкапы через COPY в сжатые файлы.
+
+Каждый снимок — каталог BACKUP_DIR/<время>-<full|delta> с файлами
+<таблица>.<NNN>.csv.gz и manifest.json. Данные идут из COPY сразу
+в gzip кусками, так что память не зависит от размера таблиц.
+
+Дельта содержит строки, изменённые после предыдущего снимка (по
+updated у users и seen, created у likes/matches).
+Удаления попадают только в полный снимок. Снимки старой схемы
+восстанавливаются: views переносится в seen, прочие удалённые таблицы
+пропускаются.
+
+    python backup.py snapshot [--delta]
+    python backup.py list
+    python backup.py restore <снимок> --yes
+"""
+import os
+import sys
+import gzip
+import json
+import shutil
+import asyncio
+import logging
+import datetime
+from typing import Optional
+
+from config import BACKUP_DIR, BACKUP_KEEP, BACKUP_CHUNK_MB
+
+logger = logging.getLogger(__name__)
+
+# таблица -> (ключ для upsert, выражение "строка изменена" для дельты)
+TABLES = {
+    "users": (["user_id"], "updated"),
+    "likes": (["liker", "liked"], "created"),
+    "seen": (["viewer"], "updated"),
+    "matches": (["id"], "created"),
+}
+
+MANIFEST = "manifest.json"
+READ_CHUNK = 256 * 1024
+
+
+class _ChunkWriter:
+    """Приёмник для copy_from_query: пишет поток в gzip-файлы по chunk_bytes"""
+
+    def __init__(self, directory: str, table: str, chunk_bytes: int):
+        self.directory = directory
+        self.table = table
+        self.chunk_bytes = chunk_bytes
+        self.files = []
+        self._fh = None
+        self._written = 0
+
+    def _write(self, data: bytes):
+        # COPY отдаёт данные целыми строками, поэтому резать файл можно на границе вызова
+        if self._fh is None or self._written >= self.chunk_bytes:
+            self._close()
+            name = f"{self.table}.{len(self.files):03d}.csv.gz"
+            self._fh = gzip.open(os.path.join(self.directory, name), "wb", compresslevel=6)
+            self.files.append(name)
+            self._written = 0
+        self._fh.write(data)
+        self._written += len(data)
+
+    def _close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    async def __call__(self, data: bytes):
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._close)
+
+
+def _read_manifest(path: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_snapshots(directory: str = BACKUP_DIR):
+    """Завершённые снимки (с manifest.json) от старых к новым"""
+    if not os.path.isdir(directory):
+        return []
+    result = []
+    for name in sorted(os.listdir(directory)):
+        m = _read_manifest(os.path.join(directory, name))
+        if m:
+            m["name"] = name
+            result.append(m)
+    return result
+
+
+async def _columns(conn, table: str):
+    rows = await conn.fetch("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = $1
+        ORDER BY ordinal_position
+    """, table)
+    return [r["column_name"] for r in rows]
+
+
+async def snapshot(pool, delta: bool = False, directory: str = BACKUP_DIR) -> dict:
+    """Снимает полный бэкап или дельту от последнего снимка, затем чистит старые"""
+    previous = list_snapshots(directory)
+    fulls = [s for s in previous if s["kind"] == "full"]
+    if delta and not fulls:
+        logger.info("Полного снимка ещё нет, снимаем полный")
+        delta = False
+
+    kind = "delta" if delta else "full"
+    name = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%S") + "-" + kind
+    path = os.path.join(directory, name)
+    os.makedirs(path, exist_ok=True)
+
+    manifest = {"kind": kind, "tables": {}}
+    if delta:
+        manifest["base"] = fulls[-1]["name"]
+        manifest["since"] = previous[-1]["started_at"]
+
+    chunk_bytes = BACKUP_CHUNK_MB * 1024 * 1024
+    async with pool.acquire() as conn:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            manifest["started_at"] = await conn.fetchval("SELECT LOCALTIMESTAMP::text")
+            for table, (_, changed) in TABLES.items():
+                if delta and not changed:
+                    continue
+                cols = await _columns(conn, table)
+                query = f"SELECT {', '.join(cols)} FROM {table}"
+                args = []
+                if delta:
+                    query += f" WHERE {changed} > $1::text::timestamp"
+                    args.append(manifest["since"])
+                writer = _ChunkWriter(path, table, chunk_bytes)
+                try:
+                    status = await conn.copy_from_query(query, *args, output=writer, format="csv")
+                finally:
+                    await writer.close()
+                manifest["tables"][table] = {
+                    "columns": cols,
+                    "files": writer.files,
+                    "rows": int(status.split()[-1]),
+                }
+
+    tmp = os.path.join(path, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+    rows = sum(t["rows"] for t in manifest["tables"].values())
+    logger.info(f"💾 Бэкап {name}: {rows} строк")
+
+    await asyncio.get_running_loop().run_in_executor(None, rotate, directory)
+    manifest["name"] = name
+    return manifest
+
+
+def rotate(directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP):
+    """Оставляет keep последних полных снимков и их дельты, остальное удаляет"""
+    if not os.path.isdir(directory):
+        return
+    snaps = list_snapshots(directory)
+    kept = {s["name"] for s in snaps if s["kind"] == "full"}
+    kept = set(sorted(kept)[-keep:]) if keep else kept
+    kept |= {s["name"] for s in snaps if s["kind"] == "delta" and s.get("base") in kept}
+    for name in os.listdir(directory):
+        full = os.path.join(directory, name)
+        if not os.path.isdir(full) or name in kept:
+            continue
+        # незавершённые снимки без манифеста тоже удаляем
+        shutil.rmtree(full, ignore_errors=True)
+        logger.info(f"🗑 Удалён старый бэкап {name}")
+
+
+async def _file_source(path: str):
+    loop = asyncio.get_running_loop()
+    fh = await loop.run_in_executor(None, gzip.open, path, "rb")
+    try:
+        while True:
+            data = await loop.run_in_executor(None, fh.read, READ_CHUNK)
+            if not data:
+                break
+            yield data
+    finally:
+        fh.close()
+
+
+async def _load(conn, path: str, table: str, spec: dict, upsert: bool):
+    cols = spec["columns"]
+    target = table
+    if upsert:
+        target = f"_restore_{table}"
+        await conn.execute(f"CREATE TEMP TABLE {target} (LIKE {table})")
+    for name in spec["files"]:
+        await conn.copy_to_table(target, source=_file_source(os.path.join(path, name)),
+                                 columns=cols, format="csv")
+    if upsert:
+        key, _ = TABLES[table]
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in cols if c not in key)
+        action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        await conn.execute(f"""
+            INSERT INTO {table}({', '.join(cols)})
+            SELECT {', '.join(cols)} FROM {target}
+            ON CONFLICT ({', '.join(key)}) {action}
+        """)
+        await conn.execute(f"DROP TABLE {target}")
+
+
+async def _load_views(conn, path: str, spec: dict):
+    """views из снимков до миграции 0007: переносится в seen так же, как в самой миграции"""
+    cols = spec["columns"]
+    await conn.execute(f"CREATE TEMP TABLE _restore_views ({', '.join(f'{c} TEXT' for c in cols)})")
+    for name in spec["files"]:
+        await conn.copy_to_table("_restore_views", source=_file_source(os.path.join(path, name)),
+                                 columns=cols, format="csv")
+    await conn.execute("""
+        SELECT seen_add(viewer::bigint, array_agg(viewed::bigint))
+        FROM _restore_views GROUP BY viewer
+    """)
+    await conn.execute("DROP TABLE _restore_views")
+
+
+async def restore(pool, name: str, directory: str = BACKUP_DIR):
+    """Восстанавливает снимок; для дельты — базовый полный снимок и все дельты до неё"""
+    snaps = {s["name"]: s for s in list_snapshots(directory)}
+    if name not in snaps:
+        raise ValueError(f"Снимок {name} не найден в {directory}")
+    target = snaps[name]
+    base = snaps[target["base"]] if target["kind"] == "delta" else target
+    chain = [base] + [
+        s for s in snaps.values()
+        if s["kind"] == "delta" and s.get("base") == base["name"] and s["name"] <= name
+    ]
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(f"TRUNCATE {', '.join(TABLES)}")
+            for snap in chain:
+                path = os.path.join(directory, snap["name"])
+                for table, spec in snap["tables"].items():
+                    if table == "views":
+                        await _load_views(conn, path, spec)
+                    elif table in TABLES:
+                        await _load(conn, path, table, spec, upsert=snap["kind"] == "delta")
+                    else:
+                        logger.warning(f"⚠️ Таблицы {table} из снимка {snap['name']} больше нет, пропускаем")
+                logger.info(f"♻️ Применён снимок {snap['name']}")
+            await conn.execute(
+                "SELECT setval(pg_get_serial_sequence('matches', 'id'), COALESCE(MAX(id), 1)) FROM matches"
+            )
+
+
+async def _main(argv):
+    from db import Database
+
+    if not argv or argv[0] not in ("snapshot", "list", "restore"):
+        print(__doc__)
+        return 2
+    if argv[0] == "list":
+        for s in list_snapshots():
+            rows = sum(t["rows"] for t in s["tables"].values())
+            print(f"{s['name']}\t{s['kind']}\t{rows} строк")
+        return 0
+    if argv[0] == "restore" and (len(argv) < 2 or "--yes" not in argv):
+        print("Восстановление перезапишет таблицы: python backup.py restore <снимок> --yes")
+        return 2
+
+    db = Database()
+    await db.init()
+    try:
+        if argv[0] == "snapshot":
+            await snapshot(db.pool, delta="--delta" in argv)
+        else:
+            await restore(db.pool, argv[1])
+    finally:
+        await db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
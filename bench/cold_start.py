@@ -0,0 +1,155 @@
+# bench/cold_start.py
+"""Холодный старт: время до первого ответа на вебхук в свежем процессе.
+
+Каждый запуск — новый интерпретатор (как новый serverless-инстанс):
+импорт точки входа, первый апдейт /start через ASGI-приложение
+serverless.py (или on_startup + feed_webhook_update из bot.py для
+сравнения), затем несколько тёплых апдейтов. Bot API — локальная
+заглушка, база — локальный Postgres со схемой (миграции применяются
+один раз перед замером).
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/tgbot_bench \\
+    python -m bench.cold_start --runs 5 --target serverless
+
+Печатает медианы: import, init, first (импорт + первый ответ целиком),
+process (с запуском интерпретатора), warm (следующие апдейты).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+from bench.fake_api import FakeBotAPI
+
+USER = 10_000_000
+
+
+def _update(n: int, text: str) -> dict:
+    user = {"id": USER, "is_bot": False, "first_name": "Cold", "username": "cold"}
+    return {"update_id": n, "message": {"message_id": n, "date": int(time.time()), "text": text,
+                                        "chat": {"id": USER, "type": "private"}, "from": user}}
+
+
+async def _asgi_post(app, update: dict) -> int:
+    body = json.dumps(update).encode()
+    scope = {"type": "http", "method": "POST", "path": "/api/webhook",
+             "headers": [(b"content-type", b"application/json")]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"]
+
+
+async def _child_serverless(warm: int) -> dict:
+    t0 = time.perf_counter()
+    import serverless
+    imported = time.perf_counter()
+    status = await _asgi_post(serverless.app, _update(1, "/start"))
+    first = time.perf_counter()
+    lat = []
+    for i in range(warm):
+        t = time.perf_counter()
+        await _asgi_post(serverless.app, _update(2 + i, "📄 Моя анкета"))
+        lat.append(time.perf_counter() - t)
+    await serverless.lazy.close()
+    return {"import": imported - t0, "init": serverless.lazy.started_in, "first": first - t0,
+            "warm": statistics.median(lat) if lat else 0.0, "status": status}
+
+
+async def _child_bot(warm: int) -> dict:
+    t0 = time.perf_counter()
+    from aiohttp import web
+    import bot as app_module
+    imported = time.perf_counter()
+    runner = web.AppRunner(app_module.app)
+    await runner.setup()  # on_startup
+    started = time.perf_counter()
+    await app_module.dp.feed_webhook_update(app_module.bot, _update(1, "/start"))
+    first = time.perf_counter()
+    lat = []
+    for i in range(warm):
+        t = time.perf_counter()
+        await app_module.dp.feed_webhook_update(app_module.bot, _update(2 + i, "📄 Моя анкета"))
+        lat.append(time.perf_counter() - t)
+    await runner.cleanup()
+    return {"import": imported - t0, "init": started - imported, "first": first - t0,
+            "warm": statistics.median(lat) if lat else 0.0, "status": 200}
+
+
+def child(target: str, warm: int):
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    run = _child_serverless if target == "serverless" else _child_bot
+    print(json.dumps(asyncio.run(run(warm))))
+
+
+async def _prepare(database_url: str):
+    import asyncpg
+    import migrate
+    conn = await asyncpg.connect(database_url, ssl=False)
+    try:
+        await migrate.upgrade(conn)
+        await conn.execute("DELETE FROM users WHERE user_id = $1", USER)
+    finally:
+        await conn.close()
+
+
+async def parent(args) -> dict:
+    await _prepare(args.database_url)
+    api = FakeBotAPI(args.api_latency_ms)
+    api_url = await api.start()
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN="1:bench", WEBHOOK_URL="https://bench.invalid/api/webhook",
+               DATABASE_URL=args.database_url, TELEGRAM_API_URL=api_url, DB_SSL="disable")
+    runs = []
+    try:
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "bench.cold_start", "--child", args.target, "--warm", str(args.warm),
+                env=env, stdout=subprocess.PIPE)
+            out, _ = await proc.communicate()
+            if proc.returncode:
+                raise RuntimeError(f"child exited with {proc.returncode}")
+            result = json.loads(out.decode().strip().splitlines()[-1])
+            result["process"] = time.perf_counter() - t0
+            runs.append(result)
+    finally:
+        await api.stop()
+    summary = {k: round(statistics.median(r[k] for r in runs) * 1000, 1)
+               for k in ("import", "init", "first", "process", "warm")}
+    summary["set_webhook_calls"] = api.calls["setWebhook"]
+    summary["errors"] = sum(1 for r in runs if r["status"] != 200)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--target", choices=("serverless", "bot"), default="serverless")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm", type=int, default=5, help="тёплых апдейтов после первого")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument("--child", choices=("serverless", "bot"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child(args.child, args.warm)
+        return 0
+    if not args.database_url:
+        parser.error("нужен --database-url или BENCH_DATABASE_URL (локальная тестовая база)")
+    summary = asyncio.run(parent(args))
+    print(f"{args.target}: " + "  ".join(f"{k}: {v}" for k, v in summary.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+# bench/compare.py
+"""Сравнение двух результатов bench.run по хендлерам.
+
+    python -m bench.compare bench/results/old.json bench/results/new.json
+"""
+import sys
+import json
+
+
+def _delta(old: float, new: float) -> str:
+    if not old:
+        return "   n/a"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def compare(old: dict, new: dict):
+    o, n = old["run"], new["run"]
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    for key in ("updates_per_sec", "db_per_update", "api_per_update"):
+        print(f"  {key:<18}{o[key]:>10}{n[key]:>10}  {_delta(o[key], n[key])}")
+    print(f"{'handler':<24}{'p95 old':>10}{'p95 new':>10}{'Δp95':>9}{'db old':>8}{'db new':>8}")
+    for name in sorted(set(o["handlers"]) | set(n["handlers"])):
+        ho, hn = o["handlers"].get(name), n["handlers"].get(name)
+        if not ho or not hn:
+            print(f"{name:<24}{'только в ' + ('новом' if hn else 'старом'):>20}")
+            continue
+        print(f"{name:<24}{ho['p95_ms']:>10.2f}{hn['p95_ms']:>10.2f}{_delta(ho['p95_ms'], hn['p95_ms']):>9}"
+              f"{ho['db_per_update']:>8.2f}{hn['db_per_update']:>8.2f}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print(__doc__)
+        return 2
+    with open(argv[0]) as f:
+        old = json.load(f)
+    with open(argv[1]) as f:
+        new = json.load(f)
+    compare(old, new)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# bench/fake_api.py
+"""Локальная заглушка Bot API для бенчмарков и тестов.
+
+Отвечает на любые методы правдоподобными результатами и считает
+вызовы по методам. Задержка ответа имитирует сеть до api.telegram.org.
+
+    python -m bench.fake_api --port 8081 --latency-ms 30
+"""
+import time
+import asyncio
+import argparse
+import itertools
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+_MESSAGE_METHODS = {"sendMessage", "sendPhoto", "editMessageText", "editMessageCaption", "editMessageMedia",
+                    "editMessageReplyMarkup", "copyMessage", "forwardMessage"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.calls = Counter()
+        self.webhook_url = ""  # setWebhook запоминается, getWebhookInfo его возвращает
+        self._message_ids = itertools.count(1)
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    def reset(self):
+        self.calls.clear()
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        return dict(await request.post())
+
+    def _message(self, params: dict) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        msg = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if "text" in params:
+            msg["text"] = params["text"]
+        if "photo" in params or "media" in params:
+            msg["photo"] = [{"file_id": "bench", "file_unique_id": "bench", "width": 1, "height": 1}]
+        return msg
+
+    def result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": 0}
+        if method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+        if method == "deleteWebhook":
+            self.webhook_url = ""
+        if method in _MESSAGE_METHODS:
+            return self._message(params)
+        if method == "sendMediaGroup":
+            return [self._message({"chat_id": params.get("chat_id"), "photo": 1})]
+        return True
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self.result(method, params)})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает его базовый URL"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(FakeBotAPI(args.latency_ms).app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
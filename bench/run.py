@@ -0,0 +1,348 @@
+# bench/run.py
+"""Сквозной бенчмарк: app из bot.py + локальный Postgres + заглушка Bot API.
+
+Поднимает aiohttp-приложение бота (on_startup: пул, миграции, хендлеры),
+регистрирует --users пользователей и гоняет смесь апдейтов через
+dp.feed_webhook_update с заданной конкурентностью. Для каждого хендлера
+считает p50/p95/p99, а также запросы к БД и вызовы Bot API на апдейт.
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/tgbot_bench \\
+    python -m bench.run --users 500 --updates 20000 --concurrency 64 \\
+        --mix browse=10,swipe=70,matches=8,profile=5,start=5,admin=2 \\
+        --out bench/results/$(git rev-parse --short HEAD).json
+
+Сравнение двух прогонов: python -m bench.compare old.json new.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import functools
+import itertools
+import contextvars
+import subprocess
+from collections import Counter, defaultdict
+
+from bench.fake_api import FakeBotAPI
+
+FIRST_USER = 10_000_000
+TABLES_KEEP = ("schema_migrations",)
+
+_current = contextvars.ContextVar("bench_update", default=None)
+_background = Counter()
+
+
+class _UpdateStats:
+    __slots__ = ("handler", "db", "api")
+
+    def __init__(self):
+        self.handler = "unhandled"
+        self.db = 0
+        self.api = 0
+
+
+def _patch_asyncpg():
+    """Считает запросы к БД (каждый — сетевой round trip) на текущий апдейт"""
+    from asyncpg.connection import Connection
+
+    for name in ("execute", "executemany", "fetch", "fetchrow", "fetchval", "copy_from_query", "copy_to_table"):
+        orig = getattr(Connection, name)
+
+        @functools.wraps(orig)
+        def wrapper(self, *args, __orig=orig, **kwargs):
+            st = _current.get()
+            if st is None:
+                _background["db"] += 1
+            else:
+                st.db += 1
+            return __orig(self, *args, **kwargs)
+
+        setattr(Connection, name, wrapper)
+
+
+async def _api_probe(make_request, bot, method):
+    st = _current.get()
+    if st is None:
+        _background["api"] += 1
+    else:
+        st.api += 1
+    return await make_request(bot, method)
+
+
+def _handler_probe():
+    from aiogram import BaseMiddleware
+
+    class HandlerProbe(BaseMiddleware):
+        async def __call__(self, handler, event, data):
+            st = _current.get()
+            if st is not None:
+                st.handler = data["handler"].callback.__name__
+            return await handler(event, data)
+
+    return HandlerProbe()
+
+
+class Traffic:
+    """Синтетические апдейты Telegram"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _user(uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"U{uid}", "username": f"u{uid}"}
+
+    def message(self, uid: int, text: str = None, photo: bool = False) -> dict:
+        n = next(self._ids)
+        msg = {"message_id": n, "date": int(time.time()), "chat": {"id": uid, "type": "private"},
+               "from": self._user(uid)}
+        if photo:
+            msg["photo"] = [{"file_id": f"photo{uid}", "file_unique_id": f"p{uid}", "width": 640, "height": 640}]
+        else:
+            msg["text"] = text
+        return {"update_id": n, "message": msg}
+
+    def callback(self, uid: int, data: str) -> dict:
+        n = next(self._ids)
+        return {"update_id": n, "callback_query": {
+            "id": str(n), "from": self._user(uid), "chat_instance": str(uid), "data": data,
+            "message": {"message_id": n, "date": int(time.time()), "chat": {"id": uid, "type": "private"},
+                        "photo": [{"file_id": "card", "file_unique_id": "card", "width": 1, "height": 1}]},
+        }}
+
+
+def registration(t: Traffic, uid: int):
+    return [t.message(uid, "/start"), t.message(uid, f"Bench {uid}"), t.message(uid, str(random.randint(16, 30))),
+            t.message(uid, "Синтетическая анкета для бенчмарка."), t.message(uid, photo=True)]
+
+
+def scenario(name: str, t: Traffic, uid: int, users: list, admin: int):
+    if name == "browse":
+        return [t.message(uid, "🔍 Смотреть анкеты")]
+    if name == "swipe":
+        kind = random.choices(("like", "skip", "superlike"), (60, 35, 5))[0]
+        target = random.choice(users)
+        return [t.callback(uid, f"{kind}:{target}")] if target != uid else []
+    if name == "matches":
+        return [t.message(uid, "❤️ Мои мэтчи")]
+    if name == "profile":
+        return [t.message(uid, "📄 Моя анкета")]
+    if name == "start":
+        return [t.message(uid, "/start")]
+    if name == "admin":
+        return [t.message(admin, "/admin")]
+    raise ValueError(f"unknown scenario: {name}")
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def _percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p * len(sorted_values)) - 1)]
+
+
+def summarize(samples, elapsed: float) -> dict:
+    by_handler = defaultdict(list)
+    for s in samples:
+        by_handler[s[0]].append(s)
+    handlers = {}
+    for name, rows in sorted(by_handler.items()):
+        lat = sorted(r[1] * 1000 for r in rows)
+        handlers[name] = {
+            "count": len(rows),
+            "p50_ms": round(_percentile(lat, 0.50), 3),
+            "p95_ms": round(_percentile(lat, 0.95), 3),
+            "p99_ms": round(_percentile(lat, 0.99), 3),
+            "db_per_update": round(sum(r[2] for r in rows) / len(rows), 3),
+            "api_per_update": round(sum(r[3] for r in rows) / len(rows), 3),
+        }
+    n = len(samples) or 1
+    return {
+        "updates": len(samples),
+        "duration_s": round(elapsed, 3),
+        "updates_per_sec": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "db_per_update": round(sum(s[2] for s in samples) / n, 3),
+        "api_per_update": round(sum(s[3] for s in samples) / n, 3),
+        "errors": sum(1 for s in samples if s[4]),
+        "handlers": handlers,
+    }
+
+
+async def _feed(dp, bot, update: dict, samples: list):
+    st = _UpdateStats()
+    _current.set(st)
+    error = False
+    t0 = time.perf_counter()
+    try:
+        await dp.feed_webhook_update(bot, update)
+    except Exception:
+        error = True
+    samples.append((st.handler, time.perf_counter() - t0, st.db, st.api, error))
+
+
+async def feed(dp, bot, update: dict, samples: list):
+    # отдельная задача = отдельный контекст, счётчики не смешиваются между апдейтами
+    await asyncio.create_task(_feed(dp, bot, update, samples))
+
+
+async def _reset(db):
+    async with db.pool.acquire() as conn:
+        tables = [r["tablename"] for r in await conn.fetch(
+            "SELECT tablename FROM pg_tables WHERE schemaname = current_schema()")]
+        tables = [t for t in tables if t not in TABLES_KEEP]
+        if tables:
+            await conn.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY")
+        # строки, которые создают сами миграции (0006): база как сразу после migrate.py up
+        await conn.execute("INSERT INTO maintenance(job) VALUES ('cleanup')")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(args.api_latency_ms)
+    api_url = await api.start()
+
+    users = list(range(FIRST_USER, FIRST_USER + args.users))
+    admin = users[0]
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "1:bench",
+        "WEBHOOK_URL": "https://bench.invalid/api/webhook",
+        "DATABASE_URL": args.database_url,
+        "TELEGRAM_API_URL": api_url,
+        "MIGRATE_ON_START": "1",
+        "ADMIN_ID": str(admin),
+    })
+    os.environ.setdefault("DB_SSL", "disable")
+
+    import config
+    if not args.keep_rate_limit:
+        # виртуальные пользователи кликают быстрее живых
+        config.RATE_LIMIT_MAX = 10 ** 9
+
+    _patch_asyncpg()
+    import logging
+    from aiohttp import web
+    import bot as app_module
+
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    dp, bot = app_module.dp, app_module.bot
+    probe = _handler_probe()
+    dp.message.middleware(probe)
+    dp.callback_query.middleware(probe)
+    bot.session.middleware(_api_probe)
+
+    runner = web.AppRunner(app_module.app)
+    await runner.setup()  # on_startup
+    try:
+        if args.reset:
+            await _reset(app_module.db)
+            if app_module.db.user_cache:
+                app_module.db.user_cache.clear()
+
+        traffic = Traffic()
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def register(uid):
+            async with sem:
+                for u in registration(traffic, uid):
+                    await feed(dp, bot, u, reg_samples)
+
+        reg_samples = []
+        t0 = time.perf_counter()
+        await asyncio.gather(*(register(uid) for uid in users))
+        reg_elapsed = time.perf_counter() - t0
+
+        api.reset()
+        _background.clear()
+        mix = _parse_mix(args.mix)
+        names, weights = list(mix), list(mix.values())
+        samples = []
+        remaining = itertools.count()
+
+        async def worker(own):
+            # у каждого воркера свои пользователи — апдейты одного пользователя идут по порядку
+            while next(remaining) < args.updates:
+                uid = random.choice(own)
+                for u in scenario(random.choices(names, weights)[0], traffic, uid, users, admin):
+                    await feed(dp, bot, u, samples)
+
+        workers = min(args.concurrency, len(users))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(users[i::workers]) for i in range(workers)))
+        elapsed = time.perf_counter() - t0
+        # даём фоновым задачам (outbox, дозагрузка анкет) доделать работу
+        await asyncio.sleep(args.settle)
+    finally:
+        await runner.cleanup()  # on_shutdown
+        await api.stop()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "args": vars(args),
+        },
+        "registration": summarize(reg_samples, reg_elapsed),
+        "run": summarize(samples, elapsed),
+        "api_methods": dict(api.calls),
+        "background": {"db_round_trips": _background["db"], "api_calls": _background["api"]},
+    }
+
+
+def _print(result: dict):
+    r = result["run"]
+    print(f"updates/sec: {r['updates_per_sec']}  db/update: {r['db_per_update']}  "
+          f"api/update: {r['api_per_update']}  errors: {r['errors']}")
+    print(f"{'handler':<24}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'db':>7}{'api':>7}")
+    for name, h in r["handlers"].items():
+        print(f"{name:<24}{h['count']:>8}{h['p50_ms']:>9.2f}{h['p95_ms']:>9.2f}{h['p99_ms']:>9.2f}"
+              f"{h['db_per_update']:>7.2f}{h['api_per_update']:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default="browse=10,swipe=70,matches=8,profile=5,start=5,admin=2")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument("--settle", type=float, default=1.0, help="сек на фоновые задачи после замера")
+    parser.add_argument("--keep-rate-limit", action="store_true")
+    parser.add_argument("--no-reset", dest="reset", action="store_false", help="не очищать таблицы перед прогоном")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="куда записать JSON с результатами")
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("нужен --database-url или BENCH_DATABASE_URL (локальная тестовая база, таблицы будут очищены)")
+
+    random.seed(args.seed)
+    result = asyncio.run(run(args))
+    _print(result)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,31 @@
 # bot.py
 import os
+import time
 import asyncio
 import logging
 from aiohttp import web
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
-from config import TELEGRAM_TOKEN, WEBHOOK_URL, DATABASE_URL
+from config import TELEGRAM_TOKEN, WEBHOOK_URL, DATABASE_URL, TELEGRAM_API_URL, WEBHOOK_FAST_ACK, INGEST_DRAIN_TIMEOUT
+from config import FSM_STORAGE, METRICS_TOKEN, RANKING_ENABLED, WEBHOOK_REPLY
+from config import PORT, WEB_WORKERS, WORKER_INDEX
 
 # Импорты
 from db import Database
 from handlers import register_handlers
+from broadcast import Broadcaster
+from outbox import OutboxDispatcher
+from ingest import UpdateIngest, raw_partition_key
+from fsm_storage import PgStorage
+from maintenance import Maintenance
+from ranking import RankingEngine
+from activity import ActivityTracker
+from serverless import ensure_webhook
+from webhook_reply import WebhookReply, ReplyCollector
+from supervisor import WorkerRouter, Supervisor, FORWARDED, run_worker
+import metrics
 
 # Логирование
 logging.basicConfig(level=logging.INFO)
@@ -26,41 +42,139 @@ if not WEBHOOK_URL:
 logger.info("✅ Конфигурация загружена")
 
 # Инициализация
-storage = MemoryStorage()
-bot = Bot(token=TELEGRAM_TOKEN)
-dp = Dispatcher(storage=storage)
 db = Database()
+storage = PgStorage(db) if FSM_STORAGE == "postgres" else MemoryStorage()
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=TELEGRAM_TOKEN, session=session)
+if WEBHOOK_REPLY and not WEBHOOK_FAST_ACK:
+    bot.session.middleware(ReplyCollector())
+bot.session.middleware(metrics.RequestMetricsMiddleware())
+dp = Dispatcher(storage=storage)
+broadcaster = Broadcaster(db, bot)
+outbox = OutboxDispatcher(db, bot)
+maintenance = Maintenance(db)
+ranking = RankingEngine(db) if RANKING_ENABLED else None
+activity = ActivityTracker(db, on_touch=ranking.touch if ranking else None)
+if ranking:
+    # удалённые (чисткой или delete_user) уходят из пула сразу, не дожидаясь перезагрузки
+    db.on_delete = ranking.remove
+ingest = UpdateIngest(dp, bot) if WEBHOOK_FAST_ACK else None
+# В многопроцессном режиме (supervisor.py) — номер воркера; одиночные задачи только у воркера 0
+router = WorkerRouter(WORKER_INDEX, WEB_WORKERS, PORT) if WORKER_INDEX is not None else None
+primary = not router or router.index == 0
+started_at = time.time()
+updates_handled = 0
 
 async def on_startup(app):
     """Выполняется при запуске сервера"""
     await db.init()
-    await register_handlers(dp, db, bot)
-    # Устанавливаем вебхук
-    await bot.set_webhook(url=WEBHOOK_URL)
-    logger.info(f"✅ Вебхук установлен: {WEBHOOK_URL}")
+    db.start_health_check()
+    if isinstance(storage, PgStorage):
+        storage.start()
+    await register_handlers(dp, db, bot, broadcaster, outbox, ranking, activity)
+    activity.start()
+    if ranking:
+        ranking.start()
+    outbox.start()
+    if ingest:
+        ingest.start()
+    if primary:
+        await broadcaster.resume()
+        maintenance.start()
+        # Устанавливаем вебхук, если Telegram знает другой адрес
+        await ensure_webhook(bot, WEBHOOK_URL)
 
 async def on_shutdown(app):
     """Выполняется при остановке"""
-    await bot.delete_webhook(drop_pending_updates=True)
+    if ingest:
+        await ingest.stop(INGEST_DRAIN_TIMEOUT)
+    await activity.stop()
+    await broadcaster.stop()
+    await outbox.stop()
+    await maintenance.stop()
+    if ranking:
+        await ranking.stop()
     await dp.storage.close()
-    await dp.storage.wait_closed()
+    await db.close()
+    if router:
+        # воркеры перезапускаются по одному — вебхук остаётся
+        await router.close()
+        return
+    await bot.delete_webhook(drop_pending_updates=True)
     logger.info("🔌 Вебхук удалён")
 
 async def handle_webhook(request):
     """Обрабатывает POST-запросы от Telegram"""
+    global updates_handled
     if request.content_type == 'application/json':
         update = await request.json()
-        await dp.feed_webhook_update(bot, update)
-        return web.Response()
+        if router and FORWARDED not in request.headers:
+            # апдейты пользователя обрабатывает один и тот же воркер
+            owner = router.owner(raw_partition_key(update))
+            if owner != router.index:
+                status, body, content_type = await router.forward(
+                    owner, await request.read(), {"Content-Type": request.content_type})
+                return web.Response(status=status, body=body, content_type=content_type)
+        updates_handled += 1
+        if ingest:
+            # Быстрый ответ: обработка идёт в очереди, 503 при переполнении
+            accepted = await ingest.submit(update)
+            return web.Response(status=503 if accepted is False else 200)
+        if not WEBHOOK_REPLY:
+            await dp.feed_webhook_update(bot, update)
+            return web.Response()
+        async with WebhookReply() as reply:
+            await dp.feed_webhook_update(bot, update)
+        body = reply.body()
+        return web.Response(body=body, content_type="application/json") if body else web.Response()
     return web.Response(status=403)
 
+async def handle_metrics(request):
+    """Метрики для Prometheus; GET /metrics в многопроцессном режиме — всех воркеров"""
+    auth = request.headers.get("Authorization")
+    if METRICS_TOKEN and auth != f"Bearer {METRICS_TOKEN}":
+        return web.Response(status=403)
+    body, content_type = metrics.render()
+    if request.path == "/metrics" and router:
+        # соединение досталось случайному воркеру: без сборки Prometheus видел бы счётчики вперемешку
+        parts = await router.metrics_all(body, {"Authorization": auth} if auth else None)
+        body = metrics.merge(parts)
+    return web.Response(body=body, headers={"Content-Type": content_type})
+
+def worker_health() -> dict:
+    pool = db.pool
+    return {
+        "worker": router.index if router else 0,
+        "pid": os.getpid(),
+        "ok": True,
+        "uptime": round(time.time() - started_at),
+        "updates": updates_handled,
+        "forwarded": router.forwarded if router else 0,
+        "db_pool": {"size": pool.get_size(), "idle": pool.get_idle_size()} if pool else None,
+        "ingest_depth": ingest.depth() if ingest else None,
+    }
+
+async def handle_health(request):
+    """Состояние процесса; GET /health в многопроцессном режиме — всех воркеров"""
+    if request.path == "/health" and router:
+        return web.json_response(await router.health_all(worker_health()))
+    return web.json_response(worker_health())
+
 # Создаём aiohttp-приложение
 app = web.Application()
 app.router.add_post('/api/webhook', handle_webhook)  # Путь должен совпадать с WEBHOOK_URL
+app.router.add_get('/metrics', handle_metrics)
+app.router.add_get('/metrics/worker', handle_metrics)
+app.router.add_get('/health', handle_health)
+app.router.add_get('/health/worker', handle_health)
 app.on_startup.append(on_startup)
 app.on_shutdown.append(on_shutdown)
 
 # Для локального запуска (не используется на Vercel)
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", 8080))
-    web.run_app(app, host="0.0.0.0", port=port)
+    if WORKER_INDEX is not None:
+        run_worker(app, PORT, WORKER_INDEX)
+    elif WEB_WORKERS > 1:
+        asyncio.run(Supervisor(WEB_WORKERS, PORT).run())
+    else:
+        web.run_app(app, host="0.0.0.0", port=PORT)
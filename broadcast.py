@@ -0,0 +1,153 @@
+# broadcast.py
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+
+from config import BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_PAGE
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+
+class RateLimiter:
+    """Глобальный темп отправки: не больше rate сообщений в секунду.
+
+    pause() сдвигает все следующие отправки (ответ RetryAfter от Telegram).
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._paused_until = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next, self._paused_until)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        until = asyncio.get_running_loop().time() + seconds
+        self._paused_until = max(self._paused_until, until)
+
+
+class BroadcastUnavailable(Exception):
+    """Рассылку в этом процессе запустить нельзя (текст — для админа)"""
+
+
+class NoBroadcaster:
+    """Заглушка для serverless.py: инстанс замораживается после ответа на вебхук,
+    фоновая рассылка там не доработает до конца"""
+
+    async def start(self, body: str, admin_id: Optional[int]) -> int:
+        raise BroadcastUnavailable("Рассылки работают только в долгоживущем bot.py, "
+                                   "в serverless-режиме они отключены.")
+
+    async def resume(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class _Progress:
+    __slots__ = ("sent", "failed", "blocked")
+
+    def __init__(self, sent=0, failed=0, blocked=0):
+        self.sent = sent
+        self.failed = failed
+        self.blocked = blocked
+
+
+class Broadcaster:
+    """Фоновая рассылка всем пользователям с завершённой анкетой.
+
+    Получатели читаются страницами по user_id, прогресс сохраняется
+    после каждой страницы, поэтому прерванная рассылка продолжается
+    с места остановки (последняя страница может уйти повторно).
+    """
+
+    def __init__(self, db, bot: Bot, rate: float = BROADCAST_RATE,
+                 concurrency: int = BROADCAST_CONCURRENCY, page_size: int = BROADCAST_PAGE):
+        self.db = db
+        self.bot = bot
+        self.page_size = page_size
+        self._limiter = RateLimiter(rate)
+        self._sem = asyncio.Semaphore(concurrency)
+        self._tasks = {}
+
+    async def start(self, body: str, admin_id: Optional[int]) -> int:
+        job = await self.db.broadcast_create(body, admin_id)
+        self._spawn(job)
+        return job["id"]
+
+    async def resume(self):
+        """Перезапускает рассылки, прерванные остановкой процесса"""
+        for job in await self.db.broadcasts_unfinished():
+            if job["id"] not in self._tasks:
+                logger.info(f"📢 Продолжаем рассылку #{job['id']} с user_id > {job['last_user_id']}")
+                self._spawn(job)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, job):
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+
+    async def _run(self, job):
+        job_id = job["id"]
+        text = f"📢 От админа:\n\n{job['body']}"
+        progress = _Progress(job["sent"], job["failed"], job["blocked"])
+        last = job["last_user_id"] or 0
+        try:
+            while True:
+                ids = await self.db.broadcast_recipients(last, self.page_size)
+                if not ids:
+                    break
+                await asyncio.gather(*(self._send(uid, text, progress) for uid in ids))
+                last = ids[-1]
+                await self.db.broadcast_progress(job_id, last, progress.sent, progress.failed, progress.blocked)
+            await self.db.broadcast_finish(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"broadcast #{job_id} failed")
+            return
+        logger.info(f"📢 Рассылка #{job_id} завершена: {progress.sent}/{progress.failed}/{progress.blocked}")
+        if job["admin_id"]:
+            try:
+                await self.bot.send_message(
+                    job["admin_id"],
+                    f"Рассылка #{job_id} завершена.\n"
+                    f"Отправлено: {progress.sent}\nОшибок: {progress.failed}\nЗаблокировали бота: {progress.blocked}")
+            except Exception:
+                logger.exception("broadcast report failed")
+
+    async def _send(self, chat_id: int, text: str, progress: _Progress):
+        async with self._sem:
+            for _ in range(MAX_ATTEMPTS):
+                await self._limiter.acquire()
+                try:
+                    await self.bot.send_message(chat_id, text)
+                    progress.sent += 1
+                    return
+                except TelegramRetryAfter as e:
+                    self._limiter.pause(e.retry_after)
+                except TelegramForbiddenError:
+                    progress.blocked += 1
+                    return
+                except Exception as e:
+                    logger.warning(f"broadcast to {chat_id} failed: {e}")
+                    break
+            progress.failed += 1
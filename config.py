@@ -9,6 +9,29 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("API_TOKEN")
 
 # Supabase (Session Pooler URL)
 DATABASE_URL = os.getenv("DATABASE_URL")  # обязательно: postgresql://...:6543/...
+# SSL к базе: require для Supabase, disable для локального Postgres (бенчмарк)
+DB_SSL = os.getenv("DB_SSL", "require")
+# Применять миграции при старте (по умолчанию только проверка версии схемы)
+MIGRATE_ON_START = os.getenv("MIGRATE_ON_START") == "1"
+
+# Пул соединений
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))     # открываются и прогреваются при старте
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_MAX_INACTIVE_SEC = 300       # простаивающее соединение закрывается
+DB_MAX_QUERIES = 50_000         # после стольких запросов соединение пересоздаётся
+DB_COMMAND_TIMEOUT = 10         # сек на запрос
+DB_CONNECT_TIMEOUT = 10
+DB_STATEMENT_CACHE = 100        # подготовленных запросов на соединение
+# session — пулер в сессионном режиме (Supabase :6543 session) или прямое подключение;
+# transaction — транзакционный пулер: кеш подготовленных запросов выключен, если пулер
+# сам не поддерживает их на уровне протокола (DB_POOLER_PREPARED=1, PgBouncer >= 1.21)
+DB_POOLER_MODE = os.getenv("DB_POOLER_MODE", "session")
+DB_POOLER_PREPARED = os.getenv("DB_POOLER_PREPARED") == "1"
+DB_HEALTH_SEC = 30              # проверка простаивающих соединений
+DB_HEALTH_TIMEOUT = 3
+# Пул serverless-инстанса (serverless.py): апдейты приходят по одному
+SERVERLESS_POOL_MIN = 1
+SERVERLESS_POOL_MAX = 3
 
 # Админка
 ADMIN_ID = int(os.getenv("ADMIN_ID")) if os.getenv("ADMIN_ID") else None
@@ -17,9 +40,35 @@ ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "lxsonen").lstrip("@")
 # Порт (для локального запуска или keepalive)
 PORT = int(os.getenv("PORT", "8080"))
 
+# Многопроцессный режим (supervisor.py): WEB_WORKERS воркеров на PORT через SO_REUSEPORT,
+# апдейт пользователя всегда обрабатывает воркер user_id % WEB_WORKERS
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WORKER_INDEX = int(os.getenv("WORKER_INDEX")) if os.getenv("WORKER_INDEX") else None  # задаёт supervisor
+WORKER_SOCKET_DIR = os.getenv("WORKER_SOCKET_DIR", "/tmp")  # unix-сокеты для пересылки между воркерами
+WORKER_HEALTH_SEC = 10
+WORKER_HEALTH_FAILS = 3         # столько проверок подряд без ответа — воркер перезапускается
+WORKER_STOP_TIMEOUT = 40        # сек на дообработку при остановке воркера (больше INGEST_DRAIN_TIMEOUT)
+
 # 🔥 НОВОЕ: URL вебхука для Telegram
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Например: https://your-project.vercel.app/api/webhook
 
+# Быстрый ответ на вебхук: апдейт ставится в очередь, обработка после ответа.
+# Не включать на Vercel — функция замораживается сразу после ответа.
+WEBHOOK_FAST_ACK = os.getenv("WEBHOOK_FAST_ACK") == "1"
+
+# Последний вызов Bot API апдейта (sendMessage, sendPhoto, answerCallbackQuery,
+# deleteMessage) отдаётся телом ответа на вебхук вместо отдельного запроса; 0 — выключить
+WEBHOOK_REPLY = os.getenv("WEBHOOK_REPLY", "1") == "1"
+
+# Хранилище FSM: postgres (переживает рестарты) или memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+
+# Токен для GET /metrics (Authorization: Bearer ...); пусто — без проверки
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Свой адрес Bot API (локальный сервер или заглушка для тестов), по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
 # Бизнес-правила
 MIN_AGE = 16
 MAX_AGE = 30
@@ -30,7 +79,75 @@ INACTIVE_DAYS = 30
 
 # Поведение
 BACKUP_INTERVAL_MIN = 60        # ⚠️ На Vercel бэкапы нужно делать через cron (GitHub Actions)
-LAST_ACTIVE_UPDATE_MIN = 5
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = 7                 # сколько полных снимков хранить (с их дельтами)
+BACKUP_CHUNK_MB = 64            # размер куска до сжатия
+LAST_ACTIVE_UPDATE_MIN = 5      # last_active пишется не чаще раза в N минут на пользователя
+ACTIVITY_FLUSH_SEC = 30         # как часто буфер активности сбрасывается в базу
+ACTIVITY_CACHE_SIZE = 100_000
 TTL_CACHE_SECONDS = 300
-RATE_LIMIT_WINDOW = 10
-RATE_LIMIT_MAX = 6
+RATE_LIMIT_WINDOW = 10         # сек
+RATE_LIMIT_MAX = 15             # апдейтов за окно на пользователя (сообщения и кнопки вместе)
+RATE_LIMIT_MAX_KEYS = 100_000
+
+# Просмотренные анкеты (таблица seen)
+SEEN_DECAY_DAYS = 0             # через сколько дней анкета снова может попасться; 0 — не раньше, чем кончатся новые
+SEEN_RESET_KEEP_DAYS = 1        # когда анкеты кончились: сначала забываются просмотренные раньше этого срока
+
+# Ночная чистка неактивных пользователей (maintenance.py)
+MAINTENANCE_HOUR_UTC = 1        # час запуска, вне пиковой нагрузки
+MAINTENANCE_BATCH = 500         # пользователей (или строк при поиске сирот) за транзакцию
+MAINTENANCE_DUTY = 0.25         # доля времени, которую задача занимает базу; остальное — паузы
+MAINTENANCE_LEASE_HOURS = 6
+
+# Статистика /admin (материализованные представления stats_*)
+STATS_REFRESH_SEC = 600         # не чаще, чем раз в 10 минут
+STATS_DAYS = 7                  # дней в разбивке по дням
+
+# Кеш записей users в процессе (сбрасывается при каждой записи пользователя)
+USER_CACHE_ENABLED = os.getenv("USER_CACHE", "1") != "0"
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60             # сек
+
+# Мэтчи показываются страницами (альбом до 10 фото — лимит Telegram)
+MATCHES_PAGE = 10
+
+# Подгрузка анкет пачками (очередь кандидатов на зрителя)
+PREFETCH_ENABLED = True
+PREFETCH_BATCH = 20
+PREFETCH_LOW_WATERMARK = 5
+PREFETCH_MAX_VIEWERS = 1000
+
+# Ранжирование кандидатов (ranking.py) вместо ORDER BY random()
+RANKING_ENABLED = True
+RANKING_RELOAD_SEC = 900        # полная перезагрузка пула из базы
+RANK_W_AGE = 1.0                # близость возраста
+RANK_AGE_SCALE = 3              # лет, на которых вес падает в e раз
+RANK_W_ACTIVE = 1.0             # недавняя активность
+RANK_ACTIVE_DAYS = 3            # дней, на которых вес падает в e раз
+RANK_W_LIKED = 2.0              # кандидат уже лайкнул зрителя
+RANK_W_POPULAR = 0.3            # полученные лайки (логарифм)
+RANK_FLOOR = 0.05               # минимальный вес — любая анкета может попасться
+
+# Рассылка /admin message
+BROADCAST_RATE = 25             # сообщений в секунду на весь бот (лимит Telegram ~30)
+BROADCAST_CONCURRENCY = 10
+BROADCAST_PAGE = 500
+
+# Доставка уведомлений из outbox
+OUTBOX_BATCH = 50
+OUTBOX_CONCURRENCY = 10
+OUTBOX_POLL_SEC = 2
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_LEASE_SEC = 60           # сколько запись «занята» отправителем
+
+# FSM в Postgres
+FSM_CACHE_SIZE = 20000          # сессий в памяти процесса
+FSM_FLUSH_SEC = 2               # как часто сбрасывать изменения в базу
+FSM_TTL_HOURS = 72              # брошенные сессии удаляются
+
+# Очередь апдейтов в режиме WEBHOOK_FAST_ACK
+INGEST_WORKERS = 16             # число очередей-обработчиков (партиции по user_id)
+INGEST_QUEUE_SIZE = 2000        # всего апдейтов в очередях
+INGEST_PUT_TIMEOUT = 2          # сек ожидания места в очереди, потом 503
+INGEST_DRAIN_TIMEOUT = 25       # сек на дообработку при остановке
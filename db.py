@@ -1,102 +1,393 @@
 # db.py
 import json
+import time
 import asyncio
 import logging
-from typing import Optional, List, Any
+from collections import OrderedDict
+from typing import Optional, List, Any, Callable
 import asyncpg
-from config import DATABASE_URL
+from config import DATABASE_URL, DB_SSL, USER_CACHE_ENABLED, USER_CACHE_SIZE, USER_CACHE_TTL, MIGRATE_ON_START
+from config import STATS_REFRESH_SEC, SEEN_DECAY_DAYS, SUPERLIKE_COOLDOWN
+from config import (DB_POOL_MIN, DB_POOL_MAX, DB_MAX_INACTIVE_SEC, DB_MAX_QUERIES, DB_COMMAND_TIMEOUT,
+                    DB_CONNECT_TIMEOUT, DB_STATEMENT_CACHE, DB_POOLER_MODE, DB_POOLER_PREPARED,
+                    DB_HEALTH_SEC, DB_HEALTH_TIMEOUT)
+import backup
+import metrics
+import migrate
 
 logger = logging.getLogger(__name__)
 
+_MISS = object()
+
+SSL = False if DB_SSL == "disable" else DB_SSL
+# За транзакционным пулером соседние транзакции могут попасть на разные серверные
+# соединения, и именованные подготовленные запросы (кеш asyncpg) ломаются: кеш
+# выключается, запросы готовятся безымянными. PgBouncer >= 1.21 с max_prepared_statements
+# переносит подготовленные запросы сам — тогда DB_POOLER_PREPARED=1 оставляет кеш.
+STATEMENT_CACHE = 0 if DB_POOLER_MODE == "transaction" and not DB_POOLER_PREPARED else DB_STATEMENT_CACHE
+
+# Горячие запросы вынесены в константы: прогрев соединения (_warm) должен
+# готовить ровно те же тексты, что используют методы, иначе кеш asyncpg не совпадёт
+SQL_USER_GET = "SELECT * FROM users WHERE user_id = $1"
+SQL_FSM_GET = "SELECT state, data FROM fsm_state WHERE key = $1"
+# superlike_ok — доступен ли зрителю ($2) суперлайк: состояние кнопки приходит вместе с анкетами
+SQL_GET_PROFILES = """
+    SELECT user_id, name, age, bio, photo_id,
+           (SELECT superlike_ready(v, $3) FROM users v WHERE v.user_id = $2) AS superlike_ok
+    FROM users
+    WHERE user_id = ANY($1::bigint[]) AND step = 'done'
+"""
+SQL_RANKING_CONTEXT = """
+    SELECT (SELECT age FROM users WHERE user_id = $1) AS age,
+           ARRAY(
+               SELECT seen_ids($1, $2)
+               UNION ALL
+               SELECT CASE WHEN user_a = $1 THEN user_b ELSE user_a END
+               FROM matches WHERE user_a = $1 OR user_b = $1
+           ) AS excluded,
+           ARRAY(SELECT liker FROM likes WHERE liked = $1) AS likers
+"""
+SQL_MATCH_FEED = """
+    SELECT m.id, m.created, u.user_id, u.name, u.age, u.bio, u.photo_id
+    FROM matches m
+    JOIN users u ON u.user_id = CASE WHEN m.user_a = $1 THEN m.user_b ELSE m.user_a END
+    WHERE ((m.user_a = $1 AND NOT m.shown_to_a) OR (m.user_b = $1 AND NOT m.shown_to_b))
+      AND ($2::bigint IS NULL OR (m.created, m.id) > (SELECT created, id FROM matches WHERE id = $2))
+    ORDER BY m.created, m.id
+    LIMIT $3 + 1
+"""
+
+WARMUP = (SQL_USER_GET, SQL_FSM_GET, SQL_GET_PROFILES, SQL_RANKING_CONTEXT, SQL_MATCH_FEED)
+
+
+def pool_options() -> dict:
+    """Параметры asyncpg.create_pool из config"""
+    return {
+        "min_size": DB_POOL_MIN,
+        "max_size": DB_POOL_MAX,
+        "max_inactive_connection_lifetime": DB_MAX_INACTIVE_SEC,
+        "max_queries": DB_MAX_QUERIES,
+        "command_timeout": DB_COMMAND_TIMEOUT,
+        "timeout": DB_CONNECT_TIMEOUT,
+        "statement_cache_size": STATEMENT_CACHE,
+        "ssl": SSL,
+        "server_settings": {"application_name": "tg-bot"},
+    }
+
+
+async def _warm(conn):
+    """init-колбэк пула: кладёт горячие запросы в кеш подготовленных запросов соединения"""
+    if STATEMENT_CACHE:
+        # conn.prepare() готовит запрос мимо кеша (use_cache=False), и fetch подготовил бы его
+        # заново. _get_statement — тот же путь, что у fetch/fetchrow, с тем же ключом кеша,
+        # но это закрытый API: asyncpg закреплён в requirements.txt, а если метода не станет,
+        # prepare хотя бы проверит запросы по схеме при старте
+        get_statement = getattr(conn, "_get_statement", None)
+        for query in WARMUP:
+            if get_statement is not None:
+                await get_statement(query, None)
+            else:
+                await conn.prepare(query)
+    # Parse/Describe уходят без Sync (его шлёт следующий Execute): без запроса-точки
+    # соединение осталось бы в неявной транзакции, и BEGIN ISOLATION LEVEL на нём падает
+    await conn.execute("SELECT 1")
+
+
+class UserCache:
+    """LRU-кеш записей users с TTL и счётчиками попаданий.
+
+    Любая запись в users увеличивает epoch: чтение, начатое до записи,
+    не положит в кеш устаревшую строку.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # user_id -> (expires, record)
+
+    def get(self, user_id: int):
+        item = self._data.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[user_id]
+                self.evictions += 1
+            self.misses += 1
+            return _MISS
+        self._data.move_to_end(user_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, user_id: int, record, epoch: int):
+        if epoch != self.epoch:
+            return
+        self._data[user_id] = (time.monotonic() + self.ttl, record)
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        self.epoch += 1
+        self._data.pop(user_id, None)
+
+    def clear(self):
+        self.epoch += 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
 class Database:
-    def __init__(self):
+    def __init__(self, user_cache: bool = USER_CACHE_ENABLED, background: bool = True):
         self.pool = None
+        self._raw_pool = None
+        self._health_task = None
+        # user_cache=False — без кеша (тесты; serverless, где его не инвалидируют соседние инстансы)
+        self.user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL) if user_cache else None
+        # background=False — не запускать фоновых задач (serverless: инстанс замораживается после ответа)
+        self.background = background
+        # вызывается с user_id каждого удалённого пользователя (RankingEngine.remove в bot.py)
+        self.on_delete: Optional[Callable[[int], None]] = None
+        self._stats_refresh = None
 
-    async def init(self):
-        if not self.pool:
-            self.pool = await asyncpg.create_pool(DATABASE_URL, ssl="require")
-            logger.info("✅ Подключение к Supabase установлено")
+    def _evict_user(self, user_id: int):
+        if self.user_cache:
+            self.user_cache.invalidate(user_id)
 
-        # Создание таблиц (если не существуют)
-        async with self.pool.acquire() as conn:
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS users(
-                user_id BIGINT PRIMARY KEY,
-                username TEXT,
-                name TEXT,
-                age INT,
-                bio TEXT,
-                photo_id TEXT,
-                step TEXT,
-                created_at TIMESTAMP DEFAULT NOW(),
-                last_active TIMESTAMP DEFAULT NOW(),
-                last_superlike TIMESTAMP,
-                superlike_extra INT DEFAULT 0,
-                superlike_extra_expires TIMESTAMP,
-                referrer BIGINT,
-                is_admin BOOLEAN DEFAULT FALSE
-            );
-            """)
+    def _user_deleted(self, user_id: int):
+        self._evict_user(user_id)
+        if self.on_delete:
+            self.on_delete(user_id)
 
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS likes(
-                liker BIGINT,
-                liked BIGINT,
-                type TEXT DEFAULT 'like',
-                created TIMESTAMP DEFAULT NOW(),
-                PRIMARY KEY(liker, liked)
-            );
-            """)
+    async def init(self, **pool_overrides):
+        """pool_overrides — параметры create_pool поверх config (serverless.py берёт пул поменьше)"""
+        if self.pool:
+            return
+        options = {**pool_options(), **pool_overrides}
+        # Схема меняется только миграциями (python migrate.py up), здесь лишь проверка версии.
+        # Отдельным соединением до пула: _warm готовит запросы к таблицам из миграций,
+        # на старой схеме create_pool упал бы раньше понятной ошибки ensure_current
+        conn = await asyncpg.connect(DATABASE_URL, ssl=SSL, timeout=options["timeout"],
+                                     statement_cache_size=0)
+        try:
+            if MIGRATE_ON_START:
+                await migrate.upgrade(conn)
+            await migrate.ensure_current(conn)
+        finally:
+            await conn.close()
 
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS views(
-                viewer BIGINT,
-                viewed BIGINT,
-                PRIMARY KEY(viewer, viewed)
-            );
-            """)
+        # create_pool сразу открывает min_size соединений, каждое проходит через _warm
+        self._raw_pool = await asyncpg.create_pool(DATABASE_URL, init=_warm, **options)
+        self.pool = metrics.TimedPool(self._raw_pool)
+        logger.info(f"✅ Подключение к Supabase установлено "
+                    f"(пул {options['min_size']}..{options['max_size']}, {DB_POOLER_MODE})")
 
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS matches(
-                id BIGSERIAL PRIMARY KEY,
-                user_a BIGINT,
-                user_b BIGINT,
-                created TIMESTAMP DEFAULT NOW(),
-                shown_to_a BOOLEAN DEFAULT FALSE,
-                shown_to_b BOOLEAN DEFAULT FALSE
-            );
-            """)
+    def start_health_check(self, interval: float = DB_HEALTH_SEC):
+        self._health_task = asyncio.create_task(self._health_loop(interval))
+
+    async def _health_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.health_check()
+            except Exception:
+                logger.exception("db health check failed")
+
+    async def health_check(self) -> int:
+        """Пингует простаивающие соединения пула и пересоздаёт сломанные.
 
+        Соединение, убитое пулером или сетью, иначе обнаружил бы первый
+        хендлер, которому оно досталось. Возвращает число пересозданных.
+        """
+        pool = self._raw_pool
+        idle = pool.get_idle_size()
+        if not idle:
+            return 0
+        conns = []
+        try:
+            for _ in range(idle):
+                # занятые хендлерами соединения не ждём: берём только свободные
+                conns.append(await pool.acquire(timeout=DB_HEALTH_TIMEOUT))
+                if pool.get_idle_size() == 0:
+                    break
+        except asyncio.TimeoutError:
+            pass
+
+        async def ping(conn):
+            try:
+                await conn.fetchval("SELECT 1", timeout=DB_HEALTH_TIMEOUT)
+                return True
+            except Exception:
+                return False
+
+        broken = 0
+        try:
+            results = await asyncio.gather(*(ping(c) for c in conns))
+            for conn, ok in zip(conns, results):
+                if not ok:
+                    conn.terminate()
+                    broken += 1
+        finally:
+            for conn in conns:
+                await pool.release(conn)
+        if broken:
+            metrics.DB_BROKEN.inc(broken)
+            logger.warning(f"⚠️ Пересоздано соединений с БД: {broken}")
+            # вернуть пул к min_size заранее, с прогревом, а не на первом запросе
+            fresh = []
+            try:
+                for _ in range(broken):
+                    fresh.append(await pool.acquire(timeout=DB_CONNECT_TIMEOUT))
+            finally:
+                for conn in fresh:
+                    await pool.release(conn)
+        return broken
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._raw_pool:
+            await self._raw_pool.close()
+            self._raw_pool = self.pool = None
+
+    async def cleanup_inactive_batch(self, inactive_days: int, after: tuple, limit: int):
+        """Удаляет до limit пользователей, неактивных дольше inactive_days, вместе с их
+        лайками, просмотренными анкетами и мэтчами — одна короткая транзакция.
+
+        after — курсор (last_active, user_id) предыдущей пачки. Возвращает
+        (счётчики по таблицам, новый курсор) или (None, None), если удалять больше нечего.
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch("""
+                    DELETE FROM users WHERE user_id IN (
+                        SELECT user_id FROM users
+                        WHERE last_active < NOW() - make_interval(days => $1)
+                          AND last_active >= $2 AND (last_active, user_id) > ($2, $3)
+                        ORDER BY last_active, user_id
+                        LIMIT $4
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING user_id, last_active
+                """, inactive_days, after[0], after[1], limit)
+                if not rows:
+                    return None, None
+                ids = [r["user_id"] for r in rows]
+                counts = {"users": len(ids)}
+                # в чужих seen удалённые id остаются до чистки по SEEN_DECAY_DAYS — они просто не найдутся
+                for table, cond in (("likes", "liker = ANY($1::bigint[]) OR liked = ANY($1::bigint[])"),
+                                    ("seen", "viewer = ANY($1::bigint[])"),
+                                    ("matches", "user_a = ANY($1::bigint[]) OR user_b = ANY($1::bigint[])")):
+                    status = await conn.execute(f"DELETE FROM {table} WHERE {cond}", ids)
+                    counts[table] = int(status.split()[-1])
+        for user_id in ids:
+            self._user_deleted(user_id)
+        last = max(rows, key=lambda r: (r["last_active"], r["user_id"]))
+        return counts, (last["last_active"], last["user_id"])
+
+    async def sweep_orphans_chunk(self, table: str, key: tuple, refs: tuple, after: tuple, limit: int):
+        """Просматривает limit строк table после ключа after и удаляет те, что ссылаются
+        на несуществующих пользователей. Возвращает (удалено, последний ключ) или (0, None) в конце таблицы.
+        """
+        cols = ", ".join(key)
+        params = ", ".join(f"${i + 1}" for i in range(len(key)))
+        n = len(key) + 1
+        match = " AND ".join(f"t.{k} = c.{k}" for k in key)
+        orphan = " OR ".join(f"NOT EXISTS (SELECT 1 FROM users WHERE user_id = c.{r})" for r in refs)
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(f"""
+                WITH chunk AS (
+                    SELECT {", ".join(dict.fromkeys(key + refs))} FROM {table}
+                    WHERE ({cols}) > ({params})
+                    ORDER BY {cols}
+                    LIMIT ${n}
+                ), gone AS (
+                    DELETE FROM {table} t USING chunk c
+                    WHERE {match} AND ({orphan})
+                    RETURNING 1
+                )
+                SELECT {", ".join(f"c.{k}" for k in key)}, (SELECT count(*) FROM gone) AS deleted
+                FROM chunk c
+                ORDER BY {", ".join(f"c.{k} DESC" for k in key)}
+                LIMIT 1
+            """, *after, limit)
+        if row is None:
+            return 0, None
+        return row["deleted"], tuple(row[k] for k in key)
+
+    async def maintenance_claim(self, job: str, min_gap_sec: float, lease_sec: float) -> bool:
+        """Берёт задачу в аренду, если она не шла последние min_gap_sec и не занята другим процессом"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("""
+                UPDATE maintenance SET started = NOW(), lease_until = NOW() + make_interval(secs => $3)
+                WHERE job = $1
+                  AND (lease_until IS NULL OR lease_until < NOW())
+                  AND (started IS NULL OR started < NOW() - make_interval(secs => $2))
+                RETURNING TRUE
+            """, job, float(min_gap_sec), float(lease_sec)) or False
+
+    async def maintenance_finish(self, job: str, report: dict):
+        async with self.pool.acquire() as conn:
             await conn.execute("""
-            CREATE TABLE IF NOT EXISTS backups (
-                id BIGSERIAL PRIMARY KEY,
-                created TIMESTAMP DEFAULT NOW(),
-                users_json JSONB,
-                likes_json JSONB,
-                views_json JSONB
-            );
-            """)
+                UPDATE maintenance SET finished = NOW(), lease_until = NULL, report = $2::jsonb
+                WHERE job = $1
+            """, job, json.dumps(report))
 
-    async def cleanup_old_users(self, cutoff):
-        """Удаляет пользователей, неактивных дольше cutoff"""
+    async def maintenance_last(self, job: str):
         async with self.pool.acquire() as conn:
-            await conn.execute(
-                "DELETE FROM users WHERE last_active < $1",
-                (cutoff,)
-            )
-            logger.info("🧹 Старые пользователи удалены")
+            return await conn.fetchrow("SELECT started, finished, report FROM maintenance WHERE job = $1", job)
 
     # === helpers ===
     async def user_get(self, user_id: int) -> Optional[asyncpg.Record]:
+        cache = self.user_cache
+        if cache:
+            cached = cache.get(user_id)
+            if cached is not _MISS:
+                return cached
+            epoch = cache.epoch
         async with self.pool.acquire() as conn:
-            return await conn.fetchrow("SELECT * FROM users WHERE user_id = $1", user_id)
+            row = await conn.fetchrow(SQL_USER_GET, user_id)
+        if cache:
+            cache.put(user_id, row, epoch)
+        return row
+
+    async def bootstrap_session(self, user_id: int, username: Optional[str], ref: Optional[int],
+                                is_admin: bool, bonus_days: int) -> asyncpg.Record:
+        """/start одним запросом: создаёт пользователя или обновляет username, last_active
+        и флаг админа; реферальный бонус начисляется, только если пользователь создан сейчас.
 
-    async def user_create_if_missing(self, user_id: int, username: Optional[str], ref: Optional[int] = None):
+        Возвращает строку users с полями created (новый пользователь) и credited (бонус начислен).
+        """
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-            INSERT INTO users(user_id, username, step, created_at, last_active, referrer)
-            VALUES($1, $2, 'name', NOW(), NOW(), $3) ON CONFLICT (user_id) DO NOTHING
-            """, user_id, username, ref)
+            row = await conn.fetchrow("""
+                WITH up AS (
+                    INSERT INTO users AS u (user_id, username, step, created_at, last_active, referrer, is_admin)
+                    VALUES ($1, $2, 'name', NOW(), NOW(), $3, $4)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        username = COALESCE(EXCLUDED.username, u.username),
+                        last_active = NOW(),
+                        updated = NOW(),
+                        is_admin = u.is_admin OR EXCLUDED.is_admin
+                    RETURNING u.*, (u.xmax = 0) AS created
+                ), credit AS (
+                    -- xmax = 0 — строка вставлена, а не обновлена: повторный /start ref_X бонус не даёт
+                    UPDATE users SET superlike_extra = COALESCE(superlike_extra, 0) + 1,
+                                     superlike_extra_expires = NOW() + make_interval(days => $5),
+                                     updated = NOW()
+                    WHERE user_id = $3 AND user_id <> $1 AND (SELECT created FROM up)
+                    RETURNING user_id
+                )
+                SELECT up.*, EXISTS (SELECT 1 FROM credit) AS credited FROM up
+            """, user_id, username, ref, is_admin, bonus_days)
+        self._evict_user(user_id)
+        if row["credited"]:
+            self._evict_user(ref)
+        return row
 
     async def user_update(self, user_id: int, **kwargs):
         if not kwargs:
@@ -108,103 +399,339 @@ class Database:
             cols.append(f"{k} = ${i}")
             vals.append(v)
             i += 1
-        sql = f"UPDATE users SET {', '.join(cols)} WHERE user_id = ${i}"
+        # updated — метка строки для дельта-бэкапов (backup.py)
+        sql = f"UPDATE users SET {', '.join(cols)}, updated = NOW() WHERE user_id = ${i}"
         vals.append(user_id)
         async with self.pool.acquire() as conn:
             await conn.execute(sql, *vals)
+        self._evict_user(user_id)
 
-    async def insert_like(self, liker: int, liked: int, typ: str = "like"):
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                "INSERT INTO likes(liker, liked, type) VALUES($1, $2, $3) ON CONFLICT DO NOTHING",
-                liker, liked, typ
-            )
-
-    async def exists_mutual(self, a: int, b: int) -> bool:
+    async def touch_users(self, user_ids: List[int], seen_at: list, granularity_min: float) -> int:
+        """Пакетная запись last_active; строки, обновлённые менее granularity_min минут назад, не трогаются"""
         async with self.pool.acquire() as conn:
-            r = await conn.fetchrow("SELECT 1 FROM likes WHERE liker = $1 AND liked = $2", b, a)
-            return bool(r)
-
-    async def add_view(self, viewer: int, viewed: int):
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                "INSERT INTO views(viewer, viewed) VALUES($1, $2) ON CONFLICT DO NOTHING",
-                viewer, viewed
-            )
+            status = await conn.execute("""
+                UPDATE users u SET last_active = t.ts, updated = NOW()
+                FROM unnest($1::bigint[], $2::timestamp[]) AS t(id, ts)
+                WHERE u.user_id = t.id
+                  AND (u.last_active IS NULL OR u.last_active < t.ts - make_interval(secs => $3))
+            """, user_ids, seen_at, float(granularity_min * 60))
+            return int(status.split()[-1])
 
     async def get_next_profile(self, viewer: int):
         async with self.pool.acquire() as conn:
             return await conn.fetchrow("""
-                SELECT u.user_id, u.name, u.age, u.bio, u.photo_id
+                SELECT u.user_id, u.name, u.age, u.bio, u.photo_id,
+                       (SELECT superlike_ready(v, $3) FROM users v WHERE v.user_id = $1) AS superlike_ok
                 FROM users u
                 WHERE u.step = 'done' AND u.user_id <> $1
-                  AND u.user_id NOT IN (SELECT viewed FROM views WHERE viewer = $1)
+                  AND u.user_id NOT IN (SELECT seen_ids($1, $2))
                   AND u.user_id NOT IN (
                     SELECT CASE WHEN user_a = $1 THEN user_b WHEN user_b = $1 THEN user_a END
                     FROM matches WHERE user_a = $1 OR user_b = $1
                   )
                 ORDER BY random()
                 LIMIT 1
-            """, viewer)
+            """, viewer, SEEN_DECAY_DAYS, SUPERLIKE_COOLDOWN)
+
+    async def get_next_profiles(self, viewer: int, limit: int, exclude: Optional[List[int]] = None):
+        """Пачка кандидатов для зрителя; exclude — уже стоящие в очереди"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetch("""
+                SELECT u.user_id, u.name, u.age, u.bio, u.photo_id,
+                       (SELECT superlike_ready(v, $5) FROM users v WHERE v.user_id = $1) AS superlike_ok
+                FROM users u
+                WHERE u.step = 'done' AND u.user_id <> $1
+                  AND u.user_id <> ALL($3::bigint[])
+                  AND u.user_id NOT IN (SELECT seen_ids($1, $4))
+                  AND u.user_id NOT IN (
+                    SELECT CASE WHEN user_a = $1 THEN user_b WHEN user_b = $1 THEN user_a END
+                    FROM matches WHERE user_a = $1 OR user_b = $1
+                  )
+                ORDER BY random()
+                LIMIT $2
+            """, viewer, limit, exclude or [], SEEN_DECAY_DAYS, SUPERLIKE_COOLDOWN)
 
-    async def clear_views(self, viewer: int):
+    async def get_profiles(self, user_ids: List[int], viewer: Optional[int] = None):
+        """Карточки заполненных анкет по списку id (порядок не гарантирован);
+        superlike_ok — для зрителя viewer"""
         async with self.pool.acquire() as conn:
-            await conn.execute("DELETE FROM views WHERE viewer = $1", viewer)
+            return await conn.fetch(SQL_GET_PROFILES, user_ids, viewer, SUPERLIKE_COOLDOWN)
 
-    async def create_match(self, a: int, b: int):
+    # === суперлайки: квота проверяется и списывается в SQL (superlike_ready, 0008) ===
+    async def superlike_consume(self, user_id: int) -> bool:
+        """Списывает суперлайк: сначала реферальный бонус, иначе дневной. False — недоступен.
+
+        Один условный UPDATE: параллельное нажатие ждёт блокировку строки
+        и перепроверяет условие на уже обновлённой строке, так что одну
+        квоту дважды не потратить.
+        """
         async with self.pool.acquire() as conn:
-            async with conn.transaction():
-                existing = await conn.fetchrow("""
-                    SELECT id FROM matches 
-                    WHERE (user_a = $1 AND user_b = $2) OR (user_a = $2 AND user_b = $1)
-                """, a, b)
-                if existing:
-                    return existing["id"]
-                r = await conn.fetchrow("INSERT INTO matches(user_a, user_b) VALUES($1, $2) RETURNING id", a, b)
-                return r["id"]
+            ok = await conn.fetchval("""
+                UPDATE users SET
+                    superlike_extra = CASE WHEN superlike_extra > 0 AND superlike_extra_expires > NOW()
+                                           THEN superlike_extra - 1 ELSE superlike_extra END,
+                    last_superlike = CASE WHEN superlike_extra > 0 AND superlike_extra_expires > NOW()
+                                          THEN last_superlike ELSE NOW() END,
+                    updated = NOW()
+                WHERE user_id = $1 AND superlike_ready(users, $2)
+                RETURNING true
+            """, user_id, SUPERLIKE_COOLDOWN)
+        if ok:
+            self._evict_user(user_id)
+        return bool(ok)
 
-    async def get_unshown_matches(self, user_id: int):
+    # === ранжирование (ranking.py) ===
+    async def ranking_snapshot(self):
+        """Все заполненные анкеты для пула: (ids, возраст, last_active в unix-времени, полученные лайки)"""
+        ids, age, active, likes = [], [], [], []
         async with self.pool.acquire() as conn:
-            return await conn.fetch("""
-                SELECT id, user_a, user_b FROM matches
-                WHERE (user_a = $1 AND shown_to_a = false) OR (user_b = $1 AND shown_to_b = false)
-                ORDER BY created
-            """, user_id)
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                async for r in conn.cursor("""
+                    SELECT u.user_id, u.age, EXTRACT(EPOCH FROM u.last_active)::float8 AS active,
+                           (SELECT count(*) FROM likes l WHERE l.liked = u.user_id) AS likes
+                    FROM users u
+                    WHERE u.step = 'done'
+                """, prefetch=5000):
+                    ids.append(r["user_id"])
+                    age.append(r["age"] or 0)
+                    active.append(r["active"] or 0.0)
+                    likes.append(r["likes"])
+        return ids, age, active, likes
 
-    async def mark_match_shown(self, match_id: int, for_user: int):
+    async def ranking_context(self, viewer: int):
+        """Что нужно для ранжирования зрителю: его возраст, кого исключить и кто его лайкнул"""
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT user_a, user_b FROM matches WHERE id = $1", match_id)
-            if not row:
-                return
-            if row["user_a"] == for_user:
-                await conn.execute("UPDATE matches SET shown_to_a = true WHERE id = $1", match_id)
-            elif row["user_b"] == for_user:
-                await conn.execute("UPDATE matches SET shown_to_b = true WHERE id = $1", match_id)
+            return await conn.fetchrow(SQL_RANKING_CONTEXT, viewer, SEEN_DECAY_DAYS)
 
-    async def all_users(self):
+    async def seen_forget(self, viewer: int, keep_days: int = 0) -> int:
+        """Забывает просмотры старше keep_days дней (0 — все), возвращает число забытых"""
         async with self.pool.acquire() as conn:
-            return await conn.fetch("""
-                SELECT user_id, username, name, age, bio, photo_id, last_active 
-                FROM users WHERE step = 'done'
+            return await conn.fetchval("SELECT seen_forget($1, $2)", viewer, keep_days)
+
+    async def seen_prune_chunk(self, after: int, limit: int, decay_days: int):
+        """Вычищает просмотры старше decay_days у limit зрителей после after.
+        Возвращает (изменено строк, последний зритель) или (0, None) в конце таблицы.
+        """
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                WITH chunk AS (
+                    SELECT viewer FROM seen WHERE viewer > $1 ORDER BY viewer LIMIT $2
+                ), pruned AS (
+                    UPDATE seen s SET (ids, days, updated) = (
+                        -- updated: иначе изменённые строки не попадут в дельта-бэкап
+                        SELECT COALESCE(array_agg(o.id ORDER BY o.id), '{}'),
+                               COALESCE(array_agg(o.day ORDER BY o.id), '{}'), NOW()
+                        FROM unnest(s.ids, s.days) AS o(id, day)
+                        WHERE o.day > seen_today() - $3
+                    )
+                    FROM chunk c
+                    WHERE s.viewer = c.viewer
+                      AND EXISTS (SELECT 1 FROM unnest(s.days) AS d WHERE d <= seen_today() - $3)
+                    RETURNING 1
+                )
+                SELECT max(viewer) AS last, (SELECT count(*) FROM pruned) AS pruned FROM chunk
+            """, after, limit, decay_days)
+        return row["pruned"], row["last"]
+
+    async def react(self, viewer: int, target: int, kind: str, name: Optional[str] = None) -> Optional[int]:
+        """Лайк/суперлайк/пропуск одной транзакцией. Возвращает id мэтча, если он есть.
+
+        Уведомление получателю (мэтч, суперлайк) ставится в outbox в той же транзакции;
+        name — как подписать отправителя в уведомлении.
+        """
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("SELECT react($1, $2, $3, $4)", viewer, target, kind, name)
+
+    async def match_feed(self, user_id: int, after: Optional[int], limit: int):
+        """Страница непоказанных мэтчей вместе с анкетой партнёра.
+
+        Порядок — (created, id), after — id последнего мэтча предыдущей страницы.
+        Возвращает до limit + 1 строк: лишняя означает, что есть следующая страница.
+        """
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(SQL_MATCH_FEED, user_id, after, limit)
+
+    async def get_match(self, match_id: int, user_id: int):
+        """Мэтч пользователя по id вместе с анкетой партнёра (None, если мэтч чужой)"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow("""
+                SELECT m.id, m.created, u.user_id, u.name, u.age, u.bio, u.photo_id
+                FROM matches m
+                JOIN users u ON u.user_id = CASE WHEN m.user_a = $2 THEN m.user_b ELSE m.user_a END
+                WHERE m.id = $1 AND $2 IN (m.user_a, m.user_b)
+            """, match_id, user_id)
+
+    async def mark_matches_shown(self, user_id: int, match_ids: List[int]):
+        """Отмечает мэтчи показанными пользователю одним запросом"""
+        if not match_ids:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE matches SET
+                    shown_to_a = shown_to_a OR user_a = $1,
+                    shown_to_b = shown_to_b OR user_b = $1
+                WHERE id = ANY($2::bigint[]) AND $1 IN (user_a, user_b)
+            """, user_id, match_ids)
+
+    # === статистика ===
+    async def stats(self, days: int = 7) -> dict:
+        """Агрегаты для /admin из stats_totals/stats_daily и живой счётчик активных за час.
+
+        Если агрегаты старше STATS_REFRESH_SEC, в фоне запускается их обновление,
+        а ответ строится по текущим — /admin не ждёт пересчёта. Без фоновых задач
+        (background=False) пересчёт идёт до ответа: задача, брошенная в фоне,
+        заморозилась бы вместе с serverless-инстансом.
+        """
+        async with self.pool.acquire() as conn:
+            totals = await conn.fetchrow("""
+                SELECT t.*, EXTRACT(EPOCH FROM LOCALTIMESTAMP - t.refreshed)::float8 AS age,
+                       (SELECT count(*) FROM users WHERE last_active > LOCALTIMESTAMP - INTERVAL '1 hour') AS active_1h
+                FROM stats_totals t
             """)
+            daily = await conn.fetch(
+                "SELECT * FROM stats_daily WHERE day > CURRENT_DATE - $1::int ORDER BY day DESC", days
+            )
+        result = dict(totals)
+        likes = result["likes"] + result["superlikes"]
+        # доля лайков, на которые ответили взаимностью (мэтч = два лайка)
+        result["match_rate"] = 2 * result["matches"] / likes if likes else 0.0
+        result["daily"] = [dict(r) for r in daily]
+        if result["age"] > STATS_REFRESH_SEC:
+            if self.background:
+                self._schedule_stats_refresh()
+            elif await self.stats_refresh():
+                return await self.stats(days)
+        return result
+
+    def _schedule_stats_refresh(self):
+        if self._stats_refresh and not self._stats_refresh.done():
+            return
+        self._stats_refresh = asyncio.create_task(self.stats_refresh())
+
+    async def stats_refresh(self) -> bool:
+        """Пересчитывает stats_*; False — пересчёт уже идёт в другом процессе"""
+        try:
+            async with self.pool.acquire() as conn:
+                refreshed = await conn.fetchval("SELECT refresh_stats()")
+        except Exception:
+            logger.exception("Не удалось обновить статистику")
+            return False
+        if refreshed:
+            logger.info("📊 Статистика пересчитана")
+        return refreshed
+
+    # === outbox ===
+    async def outbox_claim(self, limit: int, lease_sec: float):
+        """Забирает готовые к отправке уведомления и откладывает их на lease_sec (аренда)"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetch("""
+                UPDATE outbox SET next_attempt = NOW() + make_interval(secs => $2)
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE NOT dead AND next_attempt <= NOW()
+                    ORDER BY next_attempt
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, chat_id, kind, payload, attempts
+            """, limit, float(lease_sec))
+
+    async def outbox_complete(self, done: List[int], retry: List[tuple], dead: List[tuple]):
+        """done — id доставленных; retry — (id, задержка, ошибка, +попытка); dead — (id, ошибка)"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if done:
+                    await conn.execute("DELETE FROM outbox WHERE id = ANY($1::bigint[])", done)
+                if retry:
+                    ids, delays, errors, inc = zip(*retry)
+                    await conn.execute("""
+                        UPDATE outbox o SET attempts = o.attempts + t.inc,
+                            next_attempt = NOW() + make_interval(secs => t.delay),
+                            last_error = t.err
+                        FROM unnest($1::bigint[], $2::float8[], $3::text[], $4::int[]) AS t(id, delay, err, inc)
+                        WHERE o.id = t.id
+                    """, list(ids), [float(d) for d in delays], list(errors), list(inc))
+                if dead:
+                    ids, errors = zip(*dead)
+                    await conn.execute("""
+                        UPDATE outbox o SET dead = TRUE, attempts = o.attempts + 1, last_error = t.err
+                        FROM unnest($1::bigint[], $2::text[]) AS t(id, err)
+                        WHERE o.id = t.id
+                    """, list(ids), list(errors))
+
+    # === FSM ===
+    async def fsm_get(self, key: str):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(SQL_FSM_GET, key)
+
+    async def fsm_write(self, upserts: List[tuple], deletes: List[str]):
+        """upserts — (key, state, data_json); deletes — ключи пустых сессий"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if upserts:
+                    keys, states, data = zip(*upserts)
+                    await conn.execute("""
+                        INSERT INTO fsm_state(key, state, data, updated)
+                        SELECT k, s, d, NOW() FROM unnest($1::text[], $2::text[], $3::jsonb[]) AS t(k, s, d)
+                        ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, updated = NOW()
+                    """, list(keys), list(states), list(data))
+                if deletes:
+                    await conn.execute("DELETE FROM fsm_state WHERE key = ANY($1::text[])", deletes)
+
+    async def fsm_expire(self, ttl_sec: float) -> int:
+        async with self.pool.acquire() as conn:
+            status = await conn.execute(
+                "DELETE FROM fsm_state WHERE updated < NOW() - make_interval(secs => $1)", float(ttl_sec)
+            )
+            return int(status.split()[-1])
+
+    # === рассылки ===
+    async def broadcast_create(self, body: str, admin_id: Optional[int]):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(
+                "INSERT INTO broadcasts(body, admin_id) VALUES($1, $2) RETURNING *",
+                body, admin_id
+            )
+
+    async def broadcasts_unfinished(self):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch("SELECT * FROM broadcasts WHERE finished IS NULL ORDER BY id")
+
+    async def broadcast_recipients(self, after: int, limit: int) -> List[int]:
+        """Страница получателей после user_id = after (keyset по первичному ключу)"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT user_id FROM users
+                WHERE step = 'done' AND user_id > $1
+                ORDER BY user_id
+                LIMIT $2
+            """, after, limit)
+            return [r["user_id"] for r in rows]
+
+    async def broadcast_progress(self, job_id: int, last_user_id: int, sent: int, failed: int, blocked: int):
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE broadcasts SET last_user_id = $2, sent = $3, failed = $4, blocked = $5
+                WHERE id = $1
+            """, job_id, last_user_id, sent, failed, blocked)
+
+    async def broadcast_finish(self, job_id: int):
+        async with self.pool.acquire() as conn:
+            await conn.execute("UPDATE broadcasts SET finished = NOW() WHERE id = $1", job_id)
 
     async def delete_user(self, user_id: int):
         async with self.pool.acquire() as conn:
             await conn.execute("DELETE FROM users WHERE user_id = $1", user_id)
             await conn.execute("DELETE FROM likes WHERE liker = $1 OR liked = $1", user_id)
-            await conn.execute("DELETE FROM views WHERE viewer = $1 OR viewed = $1", user_id)
+            await conn.execute("DELETE FROM seen WHERE viewer = $1", user_id)
             await conn.execute("DELETE FROM matches WHERE user_a = $1 OR user_b = $1", user_id)
+        self._user_deleted(user_id)
 
-    async def backup_snapshot(self):
-        async with self.pool.acquire() as conn:
-            users = await conn.fetch("SELECT user_id, username, name, age, bio, photo_id, last_active FROM users")
-            likes = await conn.fetch("SELECT liker, liked, type, created FROM likes")
-            views = await conn.fetch("SELECT viewer, viewed FROM views")
-            await conn.execute("""
-                INSERT INTO backups(users_json, likes_json, views_json)
-                VALUES($1::jsonb, $2::jsonb, $3::jsonb)
-            """, 
-                json.dumps([dict(r) for r in users]),
-                json.dumps([dict(r) for r in likes]),
-                json.dumps([dict(r) for r in views])
-            )
+    async def backup_snapshot(self, delta: bool = False):
+        """Потоковый бэкап в BACKUP_DIR (см. backup.py)"""
+        return await backup.snapshot(self.pool, delta=delta)
+
+# Время, число строк и ошибки по каждому публичному методу (см. metrics.py)
+for _name, _fn in list(vars(Database).items()):
+    if not _name.startswith("_") and _name not in ("init", "close") and asyncio.iscoroutinefunction(_fn):
+        setattr(Database, _name, metrics.timed(_name)(_fn))
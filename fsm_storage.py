@@ -0,0 +1,126 @@
+# fsm_storage.py
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+from config import FSM_CACHE_SIZE, FSM_FLUSH_SEC, FSM_TTL_HOURS
+
+logger = logging.getLogger(__name__)
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(str(p) for p in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id or "", key.business_connection_id or "", key.destiny
+    ))
+
+
+class _Entry:
+    __slots__ = ("state", "data", "touched")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[dict] = None):
+        self.state = state
+        self.data = data or {}
+        self.touched = time.monotonic()
+
+
+class PgStorage(BaseStorage):
+    """FSM-хранилище в Postgres с горячим LRU-слоем в процессе.
+
+    Чтение состояния на каждом апдейте обслуживается из памяти; в базу
+    изменения уходят пачками раз в FSM_FLUSH_SEC (write-back). Сессии,
+    которых не трогали дольше FSM_TTL_HOURS, считаются брошенными и
+    удаляются и из памяти, и из таблицы.
+
+    max_entries=0 — без LRU: состояние читается из базы на каждом апдейте,
+    изменения держатся только до ближайшего flush() (serverless.py).
+    """
+
+    def __init__(self, db, max_entries: int = FSM_CACHE_SIZE, flush_interval: float = FSM_FLUSH_SEC,
+                 ttl: float = FSM_TTL_HOURS * 3600):
+        self.db = db
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._cache = OrderedDict()  # key -> _Entry
+        self._dirty = {}             # key -> _Entry, ждут записи (переживают вытеснение из LRU)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        k = _key(key)
+        now = time.monotonic()
+        e = self._cache.get(k) or self._dirty.get(k)
+        if e is None:
+            row = await self.db.fsm_get(k)
+            # пока ждали базу, запись могла появиться из другого апдейта
+            e = self._cache.get(k) or self._dirty.get(k)
+            if e is None:
+                e = _Entry(row["state"], json.loads(row["data"])) if row else _Entry()
+        elif now - e.touched > self.ttl and (e.state or e.data):
+            e.state, e.data = None, {}
+            self._dirty[k] = e
+        e.touched = now
+        self._cache[k] = e
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return e
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        e = await self._entry(key)
+        e.state = state.state if isinstance(state, State) else state
+        self._dirty[_key(key)] = e
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        e = await self._entry(key)
+        e.data = dict(data)
+        self._dirty[_key(key)] = e
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._entry(key)).data)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        upserts = [(k, e.state, json.dumps(e.data)) for k, e in batch.items() if e.state or e.data]
+        deletes = [k for k, e in batch.items() if not (e.state or e.data)]
+        try:
+            await self.db.fsm_write(upserts, deletes)
+        except Exception:
+            # вернём в очередь то, что не успели перезаписать новые изменения
+            for k, e in batch.items():
+                self._dirty.setdefault(k, e)
+            raise
+
+    async def _loop(self):
+        last_expire = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_expire > 3600:
+                    removed = await self.db.fsm_expire(self.ttl)
+                    last_expire = time.monotonic()
+                    if removed:
+                        logger.info(f"🧹 Удалено брошенных FSM-сессий: {removed}")
+            except Exception:
+                logger.exception("fsm flush failed")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
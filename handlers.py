@@ -1,35 +1,35 @@
 # handlers.py
+import json
 import asyncio
-import datetime
 import logging
-from cachetools import TTLCache
+from typing import Optional, TYPE_CHECKING
 from aiogram import types, F, Bot
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, InputMediaPhoto
 
-from config import MIN_AGE, MAX_AGE, DESC_LIMIT, SUPERLIKE_COOLDOWN, REFERRAL_BONUS_DAYS, LAST_ACTIVE_UPDATE_MIN, ADMIN_ID, ADMIN_USERNAME
+from config import MIN_AGE, MAX_AGE, DESC_LIMIT, REFERRAL_BONUS_DAYS, ADMIN_ID, ADMIN_USERNAME
+from config import PREFETCH_ENABLED, PREFETCH_BATCH, PREFETCH_LOW_WATERMARK, PREFETCH_MAX_VIEWERS, TTL_CACHE_SECONDS
+from config import RATE_LIMIT_WINDOW, RATE_LIMIT_MAX, RATE_LIMIT_MAX_KEYS, STATS_DAYS
+from config import SEEN_RESET_KEEP_DAYS, MATCHES_PAGE
 from states import ProfileStates, EditStates
+from broadcast import Broadcaster, BroadcastUnavailable
+from outbox import OutboxDispatcher
+from middlewares import RateLimitMiddleware, ActivityMiddleware
+from metrics import HandlerMetricsMiddleware
+from ratelimit import GCRALimiter
+
+if TYPE_CHECKING:
+    # только для аннотаций: numpy и cachetools не грузятся при импорте хендлеров (холодный старт)
+    from prefetch import ProfilePrefetcher
+    from ranking import RankingEngine
+    from activity import ActivityTracker
 
 logger = logging.getLogger(__name__)
 
-# Простой rate limit (память по процессу)
-_rate = {}
-
-def rate_limited(user_id: int) -> bool:
-    now = datetime.datetime.now(datetime.UTC).timestamp()
-    window = LAST_ACTIVE_UPDATE_MIN * 60 if LAST_ACTIVE_UPDATE_MIN else 300
-    rec = _rate.get(user_id, [])
-    rec = [t for t in rec if now - t < window]
-    if len(rec) >= 6:
-        _rate[user_id] = rec
-        return True
-    rec.append(now)
-    _rate[user_id] = rec
-    return False
-
-# Кеш кандидатов per user for short period
-profiles_cache = TTLCache(maxsize=1000, ttl=300)
+CAPTION_LIMIT = 1024   # лимиты Telegram на подпись к фото и текст сообщения
+MESSAGE_LIMIT = 4096
 
 def main_menu_kb():
     kb = [
@@ -53,46 +53,163 @@ def profile_action_kb(target_id: int, super_available: bool = True):
 # Глобальный экземпляр бота
 bot_instance: Bot = None
 db = None  # будет установлен в register_handlers
-
-async def show_next_profile(viewer_id: int):
-    cache_key = f"profiles_for_{viewer_id}"
-    if cache_key in profiles_cache:
-        row = profiles_cache[cache_key].pop() if profiles_cache[cache_key] else None
-    else:
-        row = await db.get_next_profile(viewer_id)
+prefetcher: "ProfilePrefetcher" = None  # очередь кандидатов, если PREFETCH_ENABLED
+broadcaster: Broadcaster = None
+outbox: OutboxDispatcher = None  # доставка уведомлений; без него outbox разбирается по опросу
+ranking: "RankingEngine" = None  # выбор кандидатов по весам, если RANKING_ENABLED
+
+async def next_candidate(viewer_id: int):
+    if prefetcher:
+        return await prefetcher.next(viewer_id)
+    if ranking:
+        rows = await ranking.next_profiles(viewer_id, 1)
+        return rows[0] if rows else None
+    return await db.get_next_profile(viewer_id)
+
+def notify_outbox(queued: bool):
+    """Будит доставщика, если react() поставил уведомление в outbox"""
+    if queued and outbox:
+        outbox.wake()
+
+def drop_candidate(viewer_id: int, target: int, matched: bool = False, liked: bool = False):
+    """Убирает оценённую анкету из очереди (и зрителя из очереди партнёра при мэтче)"""
+    if ranking and liked:
+        ranking.liked(target)
+    if not prefetcher:
+        return
+    prefetcher.discard(viewer_id, target)
+    if matched:
+        prefetcher.discard(target, viewer_id)
+
+def match_caption(row) -> str:
+    caption = f"Имя: {row['name']}\nВозраст: {row['age']}\nО себе: {row['bio']}"
+    return caption[:CAPTION_LIMIT]
+
+async def send_match_page(user_id: int, after: Optional[int]) -> int:
+    """Отправляет страницу непоказанных мэтчей: фото одним альбомом, анкеты без фото
+    одним сообщением и кнопку «Ещё», если мэтчей больше MATCHES_PAGE. Возвращает число отправленных.
+    """
+    rows = await db.match_feed(user_id, after, MATCHES_PAGE)
+    page, more = rows[:MATCHES_PAGE], len(rows) > MATCHES_PAGE
+    if not page:
+        return 0
+    photos = [r for r in page if r["photo_id"]]
+    texts = [match_caption(r) for r in page if not r["photo_id"]]
+    if len(photos) == 1:
+        await bot_instance.send_photo(user_id, photos[0]["photo_id"], caption=match_caption(photos[0]))
+    elif photos:
+        await bot_instance.send_media_group(user_id, [
+            InputMediaPhoto(media=r["photo_id"], caption=match_caption(r)) for r in photos
+        ])
+    if texts:
+        await bot_instance.send_message(user_id, "\n\n".join(texts)[:MESSAGE_LIMIT])
+    await db.mark_matches_shown(user_id, [r["id"] for r in page])
+    if more:
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Ещё мэтчи ➡️", callback_data=f"matches:{page[-1]['id']}")]
+        ])
+        await bot_instance.send_message(user_id, f"Показано {len(page)}. Есть ещё.", reply_markup=kb)
+    return len(page)
+
+async def api_group(*calls):
+    """Независимые вызовы Bot API одновременно: ошибка одного логируется и не отменяет
+    остальные. Возвращает результаты по порядку (исключение на месте упавшего)."""
+    async def call(method):
+        # методы aiogram (cq.answer(), msg.delete()) — awaitable, но не корутины: gather их не примет
+        try:
+            return await method
+        except Exception as e:
+            return e
+
+    # последний вызов — в задаче апдейта, остальные — в своих задачах: gather увёл бы
+    # в отдельную задачу и его, и ReplyCollector не смог бы отдать его телом ответа на вебхук
+    if not calls:
+        return []
+    others = [asyncio.ensure_future(call(c)) for c in calls[:-1]]
+    last = await call(calls[-1])
+    results = [*await asyncio.gather(*others), last]
+    for r in results:
+        if isinstance(r, Exception):
+            logger.warning(f"api call failed: {r!r}")
+    return results
+
+async def next_card(viewer_id: int):
+    """Следующая анкета для зрителя: (анкета, подпись, клавиатура) или None, если показывать нечего"""
+    row = await next_candidate(viewer_id)
     if not row:
-        await db.clear_views(viewer_id)
-        row = await db.get_next_profile(viewer_id)
+        # сначала возвращаем анкеты, показанные раньше SEEN_RESET_KEEP_DAYS дней, а если таких нет — все
+        if not await db.seen_forget(viewer_id, SEEN_RESET_KEEP_DAYS):
+            await db.seen_forget(viewer_id, 0)
+        if prefetcher:
+            prefetcher.forget(viewer_id)
+        row = await next_candidate(viewer_id)
         if not row:
-            await bot_instance.send_message(viewer_id, "Анкет нет.", reply_markup=main_menu_kb())
-            return
-
-    user = await db.user_get(viewer_id)
-    super_available = False
-    if user:
-        extra = user.get("superlike_extra") or 0
-        extra_expires = user.get("superlike_extra_expires")
-        if extra and extra_expires and extra_expires > datetime.datetime.now(datetime.UTC):
-            super_available = True
-        else:
-            last = user.get("last_superlike")
-            if not last or (datetime.datetime.now(datetime.UTC) - last).total_seconds() > SUPERLIKE_COOLDOWN:
-                super_available = True
+            return None
 
     caption = f"{row.get('name') or '—'}, {row.get('age') or '—'}\n\n{(row.get('bio') or '')[:DESC_LIMIT]}"
-    kb = profile_action_kb(row.get("user_id"), super_available)
-    try:
-        if row.get("photo_id"):
-            await bot_instance.send_photo(viewer_id, row.get("photo_id"), caption=caption, reply_markup=kb)
-        else:
-            await bot_instance.send_message(viewer_id, caption, reply_markup=kb)
-    except Exception as e:
-        logger.exception("send profile failed")
+    caption = caption[:CAPTION_LIMIT]  # как в match_caption: длиннее подпись к фото Telegram не примет
+    # доступность суперлайка посчитана тем же запросом, что выбрал анкету (superlike_ok)
+    return row, caption, profile_action_kb(row.get("user_id"), bool(row.get("superlike_ok")))
+
+async def show_card(viewer_id: int, card, current: Optional[types.Message] = None):
+    """Показывает карточку из next_card. current — сообщение с предыдущей карточкой:
+    оно правится на месте (фото -> фото, текст -> текст), а если нельзя — удаляется
+    одновременно с отправкой новой."""
+    # на кнопки под сообщением старше 48 часов aiogram отдаёт InaccessibleMessage:
+    # править и удалять его нельзя, просто присылаем новую карточку
+    current = current if isinstance(current, types.Message) else None
+    calls = [current.delete()] if current else []
+    if card is None:
+        await api_group(*calls, bot_instance.send_message(viewer_id, "Анкет нет.", reply_markup=main_menu_kb()))
+        return
+    row, caption, kb = card
+    photo = row.get("photo_id")
+    if current:
+        try:
+            if photo and getattr(current, "photo", None):
+                await current.edit_media(InputMediaPhoto(media=photo, caption=caption), reply_markup=kb)
+                return
+            if not photo and getattr(current, "text", None) is not None:
+                await current.edit_text(caption, reply_markup=kb)
+                return
+        except TelegramBadRequest as e:
+            # сообщение уже удалено, не изменилось и т.п. — заменяем целиком
+            logger.debug(f"card edit failed: {e}")
+    if photo:
+        calls.append(bot_instance.send_photo(viewer_id, photo, caption=caption, reply_markup=kb))
+    else:
+        calls.append(bot_instance.send_message(viewer_id, caption, reply_markup=kb))
+    await api_group(*calls)
 
-async def register_handlers(dp, database, bot: Bot):
-    global db, bot_instance
+async def show_next_profile(viewer_id: int):
+    await show_card(viewer_id, await next_card(viewer_id))
+
+async def swipe_next(cq: types.CallbackQuery, text: str):
+    """После оценки: ответ на нажатие идёт параллельно с выбором следующей анкеты,
+    затем карточка меняется на месте"""
+    _, card = await asyncio.gather(api_group(cq.answer(text)), next_card(cq.from_user.id))
+    await show_card(cq.from_user.id, card, cq.message)
+
+async def register_handlers(dp, database, bot: Bot, broadcast: Broadcaster = None,
+                            notifier: OutboxDispatcher = None, ranker: "RankingEngine" = None,
+                            activity: "ActivityTracker" = None, prefetch: bool = PREFETCH_ENABLED):
+    global db, bot_instance, prefetcher, broadcaster, outbox, ranking
     db = database
     bot_instance = bot
+    outbox = notifier
+    ranking = ranker
+    broadcaster = broadcast or Broadcaster(db, bot)
+    dp.update.outer_middleware(RateLimitMiddleware(
+        GCRALimiter(RATE_LIMIT_MAX, RATE_LIMIT_WINDOW, max_keys=RATE_LIMIT_MAX_KEYS)))
+    if activity:
+        dp.update.outer_middleware(ActivityMiddleware(activity))
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    if prefetch:
+        from prefetch import ProfilePrefetcher
+        prefetcher = ProfilePrefetcher(db, batch_size=PREFETCH_BATCH, low_watermark=PREFETCH_LOW_WATERMARK,
+                                       max_viewers=PREFETCH_MAX_VIEWERS, ttl=TTL_CACHE_SECONDS,
+                                       source=ranking.next_profiles if ranking else None)
 
     @dp.message(Command("start"))
     async def cmd_start(msg: types.Message, state: FSMContext):
@@ -104,19 +221,10 @@ async def register_handlers(dp, database, bot: Bot):
                 ref = int(args.split("_", 1)[1])
             except:
                 ref = None
-        await db.user_create_if_missing(msg.from_user.id, msg.from_user.username, ref)
-        if ref:
-            ref_user = await db.user_get(ref)
-            if ref_user:
-                await db.user_update(ref, 
-                    superlike_extra=(ref_user.get("superlike_extra", 0) + 1),
-                    superlike_extra_expires=(datetime.datetime.now(datetime.UTC) + datetime.timedelta(days=REFERRAL_BONUS_DAYS))
-                )
-        await db.user_update(msg.from_user.id, last_active=datetime.datetime.now(datetime.UTC))
-        if msg.from_user.username and msg.from_user.username.lower() == ADMIN_USERNAME.lower():
-            await db.user_update(msg.from_user.id, is_admin=True)
-        u = await db.user_get(msg.from_user.id)
-        if u and u.get("step") == "done":
+        username = msg.from_user.username
+        is_admin = bool(username and username.lower() == ADMIN_USERNAME.lower())
+        u = await db.bootstrap_session(msg.from_user.id, username, ref, is_admin, REFERRAL_BONUS_DAYS)
+        if u["step"] == "done":
             await msg.answer("С возвращением.", reply_markup=main_menu_kb())
             return
         await state.set_state(ProfileStates.name)
@@ -162,16 +270,14 @@ async def register_handlers(dp, database, bot: Bot):
                              age=data["age"],
                              bio=data["bio"],
                              photo_id=photo_id,
-                             step="done",
-                             last_active=datetime.datetime.now(datetime.UTC))
+                             step="done")
+        if ranking:
+            ranking.profile_done(msg.from_user.id, data["age"])
         await state.clear()
         await msg.answer("Анкета сохранена ✅", reply_markup=main_menu_kb())
 
     @dp.message(F.text == "🔍 Смотреть анкеты")
     async def browse(msg: types.Message):
-        if rate_limited(msg.from_user.id):
-            await msg.answer("Слишком часто. Подождите.")
-            return
         u = await db.user_get(msg.from_user.id)
         if not u or u.get("step") != "done":
             await msg.answer("Сначала заполните анкету.")
@@ -189,124 +295,70 @@ async def register_handlers(dp, database, bot: Bot):
             return
 
         if action == "skip":
-            await db.add_view(user_id, target)
-            await cq.answer("Пропущено")
-            await cq.message.delete()
-            await show_next_profile(user_id)
+            await db.react(user_id, target, "skip")
+            drop_candidate(user_id, target)
+            await swipe_next(cq, "Пропущено")
             return
 
         if action == "like":
-            await db.insert_like(user_id, target, "like")
-            await db.add_view(user_id, target)
-            mutual = await db.exists_mutual(user_id, target)
-            if mutual:
-                match_id = await db.create_match(user_id, target)
-                try:
-                    await bot_instance.send_message(target, "💌 Вам поставили симпатию! Нажмите, чтобы посмотреть.", 
-                        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                            [InlineKeyboardButton(text="👀 Посмотреть", callback_data=f"viewmatch:{match_id}")]
-                        ]))
-                except Exception:
-                    pass
-                await cq.answer("Это мэтч! 🎉")
-            else:
-                await cq.answer("Лайк сохранён")
-            await cq.message.delete()
-            await show_next_profile(user_id)
+            match_id = await db.react(user_id, target, "like")
+            drop_candidate(user_id, target, matched=bool(match_id), liked=True)
+            notify_outbox(bool(match_id))
+            await swipe_next(cq, "Это мэтч! 🎉" if match_id else "Лайк сохранён")
             return
 
         if action == "superlike":
-            u = await db.user_get(user_id)
-            allowed = False
-            if u:
-                extra = u.get("superlike_extra") or 0
-                extra_expires = u.get("superlike_extra_expires")
-                if extra and extra_expires and extra_expires > datetime.datetime.now(datetime.UTC):
-                    allowed = True
-                    await db.user_update(user_id, superlike_extra=extra - 1)
-                else:
-                    last = u.get("last_superlike")
-                    if not last or (datetime.datetime.now(datetime.UTC) - last).total_seconds() > SUPERLIKE_COOLDOWN:
-                        allowed = True
-                        await db.user_update(user_id, last_superlike=datetime.datetime.now(datetime.UTC))
-
-            if not allowed:
+            if not await db.superlike_consume(user_id):
                 await cq.answer("Суперлайк доступен 1 раз в 24 часа или по реф. бонусу.")
                 return
-
-            await db.insert_like(user_id, target, "superlike")
-            await db.add_view(user_id, target)
-            mutual = await db.exists_mutual(user_id, target)
-            if mutual:
-                match_id = await db.create_match(user_id, target)
-                try:
-                    name = (await db.user_get(user_id)).get("username") or cq.from_user.first_name
-                    await bot_instance.send_message(target, f"🌟 Вас выбрали! @{name} использовал(а) Суперлайк!", 
-                        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                            [InlineKeyboardButton(text="👀 Посмотреть", callback_data=f"viewmatch:{match_id}")]
-                        ]))
-                except Exception:
-                    pass
-                await cq.answer("Суперлайк и мэтч!")
-            else:
-                try:
-                    name = (await db.user_get(user_id)).get("username") or cq.from_user.first_name
-                    await bot_instance.send_message(target, f"🌟 У вас суперлайк от @{name}! Нажмите, чтобы посмотреть.", 
-                        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                            [InlineKeyboardButton(text="👀 Посмотреть", callback_data="noop")]
-                        ]))
-                except Exception:
-                    pass
-                await cq.answer("Суперлайк отправлен.")
-            await cq.message.delete()
-            await show_next_profile(user_id)
+            if prefetcher:
+                # у анкет в очереди superlike_ok посчитан до списания
+                prefetcher.forget(user_id)
+
+            name = cq.from_user.username or cq.from_user.first_name
+            match_id = await db.react(user_id, target, "superlike", name)
+            drop_candidate(user_id, target, matched=bool(match_id), liked=True)
+            notify_outbox(True)
+            await swipe_next(cq, "Суперлайк и мэтч!" if match_id else "Суперлайк отправлен.")
             return
 
     @dp.callback_query(lambda c: c.data and c.data.startswith("viewmatch:"))
     async def view_match(cq: types.CallbackQuery):
         mid = int(cq.data.split(":", 1)[1])
-        rows = await db.get_unshown_matches(cq.from_user.id)
-        match = None
-        for r in rows:
-            if r["id"] == mid:
-                match = r
-                break
+        match = await db.get_match(mid, cq.from_user.id)
         if not match:
             await cq.answer("Мэтч не найден")
             return
-        other = match["user_b"] if match["user_a"] == cq.from_user.id else match["user_a"]
-        u_other = await db.user_get(other)
-        if not u_other:
-            await cq.answer("Профиль не найден")
-            return
-        caption = f"Имя: {u_other.get('name')}\nВозраст: {u_other.get('age')}\nО себе: {u_other.get('bio')}"
+        caption = match_caption(match)
         try:
-            if u_other.get("photo_id"):
-                await bot_instance.send_photo(cq.from_user.id, u_other.get("photo_id"), caption=caption)
+            if match["photo_id"]:
+                await bot_instance.send_photo(cq.from_user.id, match["photo_id"], caption=caption)
             else:
                 await bot_instance.send_message(cq.from_user.id, caption)
         except:
             pass
-        await db.mark_match_shown(mid, cq.from_user.id)
+        await db.mark_matches_shown(cq.from_user.id, [mid])
         await cq.answer()
 
     @dp.message(F.text == "❤️ Мои мэтчи")
     async def my_matches(msg: types.Message):
-        rows = await db.get_unshown_matches(msg.from_user.id)
-        if not rows:
+        if not await send_match_page(msg.from_user.id, None):
             await msg.answer("Новых мэтчей нет.")
+
+    @dp.callback_query(lambda c: c.data and c.data.startswith("matches:"))
+    async def more_matches(cq: types.CallbackQuery):
+        try:
+            after = int(cq.data.split(":", 1)[1])
+        except ValueError:
+            await cq.answer("Ошибка данных.")
             return
-        for r in rows:
-            other = r["user_b"] if r["user_a"] == msg.from_user.id else r["user_a"]
-            u = await db.user_get(other)
-            if not u:
-                continue
-            caption = f"Имя: {u.get('name')}\nВозраст: {u.get('age')}\nО себе: {u.get('bio')}"
-            if u.get("photo_id"):
-                await msg.answer_photo(u.get("photo_id"), caption=caption)
-            else:
-                await msg.answer(caption)
-            await db.mark_match_shown(r["id"], msg.from_user.id)
+        await cq.answer()
+        try:
+            await cq.message.delete()
+        except Exception:
+            pass
+        if not await send_match_page(cq.from_user.id, after):
+            await bot_instance.send_message(cq.from_user.id, "Новых мэтчей нет.")
 
     @dp.message(Command("admin"))
     async def admin_cmd(msg: types.Message):
@@ -322,22 +374,36 @@ async def register_handlers(dp, database, bot: Bot):
             return
         parts = (msg.text or "").split(" ", 2)
         if len(parts) >= 3 and parts[1].lower() == "message":
-            body = parts[2]
-            users = await db.all_users()
-            sent = 0
-            for u in users:
-                try:
-                    await bot_instance.send_message(u["user_id"], f"📢 От админа:\n\n{body}")
-                    sent += 1
-                except:
-                    pass
-            await msg.answer(f"Отправлено: {sent}")
+            try:
+                job_id = await broadcaster.start(parts[2], msg.from_user.id)
+            except BroadcastUnavailable as e:
+                await msg.answer(str(e))
+                return
+            await msg.answer(f"Рассылка #{job_id} запущена, отчёт придёт по завершении.")
             return
-        users = await db.all_users()
-        total = len(users)
-        hour_ago = datetime.datetime.now(datetime.UTC) - datetime.timedelta(hours=1)
-        active = sum(1 for u in users if u.get("last_active") and u["last_active"] > hour_ago)
-        await msg.answer(f"Всего: {total}\nАктивных (1ч): {active}")
+        st = await db.stats(STATS_DAYS)
+        lines = [
+            f"Всего: {st['users']} (анкет: {st['profiles']})",
+            f"Активных: {st['active_1h']} за 1ч / {st['active_24h']} за 24ч / {st['active_7d']} за 7д",
+            f"Лайков: {st['likes']}, суперлайков: {st['superlikes']}, мэтчей: {st['matches']}",
+            f"Взаимность: {st['match_rate']:.1%}",
+            "",
+            "День: регистрации / лайки / суперлайки / мэтчи",
+        ]
+        for d in st["daily"]:
+            lines.append(f"{d['day']:%d.%m}: {d['registrations']} / {d['likes']} / {d['superlikes']} / {d['matches']}")
+        lines.append(f"Обновлено {int(st['age'] // 60)} мин назад")
+        last = await db.maintenance_last("cleanup")
+        if last and last["finished"]:
+            r = json.loads(last["report"])
+            lines.append(f"Чистка {last['finished']:%d.%m %H:%M}: {r['users']} пользователей, "
+                         f"{r['likes']} лайков, {r.get('seen', 0)} просмотров, {r['matches']} мэтчей, "
+                         f"сирот {sum(r['orphans'].values())}")
+        text = "\n".join(lines)
+        if db.user_cache:
+            c = db.user_cache.stats()
+            text += f"\nКеш анкет: {c['hits']} попаданий / {c['misses']} промахов / {c['evictions']} вытеснений"
+        await msg.answer(text)
 
     @dp.message(F.text == "👥 Посоветовать другу")
     async def invite(msg: types.Message):
@@ -409,6 +475,8 @@ async def register_handlers(dp, database, bot: Bot):
         if age < MIN_AGE: age = MIN_AGE
         if age > MAX_AGE: age = MAX_AGE
         await db.user_update(msg.from_user.id, age=age)
+        if ranking:
+            ranking.set_age(msg.from_user.id, age)
         await state.clear()
         await msg.answer("Возраст обновлён.", reply_markup=main_menu_kb())
 
@@ -0,0 +1,107 @@
+# ingest.py
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from pydantic import ValidationError
+
+from config import INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_PUT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+def partition_key(update: Update) -> int:
+    """Ключ очереди: id пользователя, иначе чата, иначе номер апдейта"""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    user = getattr(event, "from_user", None)
+    if user:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat:
+        return chat.id
+    return update.update_id
+
+
+def raw_partition_key(data: dict) -> int:
+    """partition_key по JSON апдейта, без разбора в модели aiogram (маршрутизация между воркерами)"""
+    for name, event in data.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return data.get("update_id", 0)
+
+
+class UpdateIngest:
+    """Приём вебхука без ожидания обработки.
+
+    Апдейт проверяется и кладётся в одну из `workers` очередей по id
+    пользователя; у каждой очереди свой обработчик, поэтому апдейты
+    одного пользователя идут строго по порядку, а разные пользователи
+    обрабатываются параллельно. Если очередь полна дольше put_timeout,
+    submit() возвращает False — Telegram получит 503 и повторит позже.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = INGEST_WORKERS,
+                 queue_size: int = INGEST_QUEUE_SIZE, put_timeout: float = INGEST_PUT_TIMEOUT):
+        self.dp = dp
+        self.bot = bot
+        self.put_timeout = put_timeout
+        per_queue = max(1, queue_size // workers)
+        self._queues = [asyncio.Queue(maxsize=per_queue) for _ in range(workers)]
+        self._tasks = []
+        self._closed = False
+
+    def start(self):
+        self._closed = False
+        self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def submit(self, data: dict) -> Optional[bool]:
+        """True — принят, False — очередь переполнена, None — невалидный апдейт (отбрасываем)"""
+        if self._closed:
+            return False
+        try:
+            update = Update.model_validate(data, context={"bot": self.bot})
+        except ValidationError:
+            logger.warning("invalid update dropped")
+            return None
+        q = self._queues[partition_key(update) % len(self._queues)]
+        try:
+            await asyncio.wait_for(q.put(update), self.put_timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _worker(self, q: asyncio.Queue):
+        while True:
+            update = await q.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception(f"update {update.update_id} failed")
+            finally:
+                q.task_done()
+
+    async def stop(self, timeout: float):
+        """Перестаёт принимать апдейты и дожидается обработки уже принятых"""
+        self._closed = True
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Не обработано при остановке: {self.depth()} апдейтов")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,136 @@
+# maintenance.py
+import time
+import asyncio
+import datetime
+import logging
+
+from config import (INACTIVE_DAYS, MAINTENANCE_HOUR_UTC, MAINTENANCE_BATCH, MAINTENANCE_DUTY,
+                    MAINTENANCE_LEASE_HOURS, SEEN_DECAY_DAYS)
+
+logger = logging.getLogger(__name__)
+
+JOB = "cleanup"
+
+# таблица -> (ключ для обхода по порядку, колонки со ссылками на users)
+ORPHANS = {
+    "likes": (("liker", "liked"), ("liker", "liked")),
+    "seen": (("viewer",), ("viewer",)),
+    "matches": (("id",), ("user_a", "user_b")),
+}
+
+MIN_BIGINT = -2 ** 63
+
+
+class Maintenance:
+    """Ночная чистка базы.
+
+    Раз в сутки в MAINTENANCE_HOUR_UTC удаляет неактивных дольше INACTIVE_DAYS
+    пользователей пачками по MAINTENANCE_BATCH (каждая — своя короткая транзакция,
+    вместе с лайками, просмотрами и мэтчами), затем проходит likes/seen/matches
+    и удаляет строки, оставшиеся от уже удалённых пользователей. Если задан
+    SEEN_DECAY_DAYS, из seen вычищаются и устаревшие просмотры.
+
+    Между пачками задача спит так, чтобы занимать базу не больше MAINTENANCE_DUTY
+    времени. Запуск берётся в аренду через таблицу maintenance, поэтому при
+    нескольких процессах чистку делает один; отчёт сохраняется туда же.
+    """
+
+    def __init__(self, db, inactive_days: int = INACTIVE_DAYS, batch: int = MAINTENANCE_BATCH,
+                 duty: float = MAINTENANCE_DUTY, hour: int = MAINTENANCE_HOUR_UTC,
+                 seen_decay_days: int = SEEN_DECAY_DAYS):
+        self.db = db
+        self.inactive_days = inactive_days
+        self.batch = batch
+        self.duty = duty
+        self.hour = hour
+        self.seen_decay_days = seen_decay_days
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._stop.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    def _seconds_to_window(self) -> float:
+        now = datetime.datetime.now(datetime.UTC)
+        start = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if start <= now - datetime.timedelta(hours=1):
+            start += datetime.timedelta(days=1)
+        return max(0.0, (start - now).total_seconds())
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Пауза, прерываемая остановкой; True — пора выходить"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self._stop.is_set()
+
+    async def _loop(self):
+        while not await self._sleep(self._seconds_to_window()):
+            try:
+                # min_gap меньше суток — запуск не уплывает от окна из-за длительности чистки
+                if await self.db.maintenance_claim(JOB, 20 * 3600, MAINTENANCE_LEASE_HOURS * 3600):
+                    await self.run()
+            except Exception:
+                logger.exception("maintenance failed")
+            # окно длится час: не проверять аренду повторно до следующих суток
+            if await self._sleep(3600):
+                break
+
+    async def _throttle(self, busy: float) -> bool:
+        return await self._sleep(busy * (1 - self.duty) / self.duty)
+
+    async def run(self) -> dict:
+        """Один проход чистки; возвращает и сохраняет отчёт"""
+        started = time.monotonic()
+        report = {"users": 0, "likes": 0, "seen": 0, "matches": 0, "orphans": {}}
+
+        cursor = (datetime.datetime.min, MIN_BIGINT)
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            counts, cursor = await self.db.cleanup_inactive_batch(self.inactive_days, cursor, self.batch)
+            if counts is None:
+                break
+            for table, n in counts.items():
+                report[table] += n
+            await self._throttle(time.monotonic() - t0)
+
+        for table, (key, refs) in ORPHANS.items():
+            removed = 0
+            after = (MIN_BIGINT,) * len(key)
+            while not self._stop.is_set():
+                t0 = time.monotonic()
+                n, after = await self.db.sweep_orphans_chunk(table, key, refs, after, self.batch)
+                removed += n
+                if after is None:
+                    break
+                await self._throttle(time.monotonic() - t0)
+            report["orphans"][table] = removed
+
+        if self.seen_decay_days > 0:
+            report["seen_pruned"] = 0
+            after = MIN_BIGINT
+            while not self._stop.is_set():
+                t0 = time.monotonic()
+                n, after = await self.db.seen_prune_chunk(after, self.batch, self.seen_decay_days)
+                report["seen_pruned"] += n
+                if after is None:
+                    break
+                await self._throttle(time.monotonic() - t0)
+
+        report["seconds"] = round(time.monotonic() - started, 1)
+        report["interrupted"] = self._stop.is_set()
+        await self.db.maintenance_finish(JOB, report)
+        logger.info(
+            f"🧹 Чистка: удалено {report['users']} пользователей, {report['likes']} лайков, "
+            f"{report['seen']} просмотров, {report['matches']} мэтчей, "
+            f"сирот {sum(report['orphans'].values())} за {report['seconds']} с"
+        )
+        return report
@@ -0,0 +1,186 @@
+# metrics.py
+"""Метрики в формате Prometheus (GET /metrics).
+
+Хендлеры, методы Database, ожидание соединения из пула и вызовы
+Bot API. Запись — perf_counter и observe() у заранее созданного
+дочернего счётчика, без лишних аллокаций на горячем пути.
+"""
+import time
+import functools
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.metrics_core import Metric
+from prometheus_client.parser import text_string_to_metric_families
+
+# Границы бакетов в секундах: от быстрого запроса по индексу до зависшего Bot API
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 20, 100, 500, 2000, 10000)
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработки апдейта хендлером",
+                            ["handler"], buckets=BUCKETS)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в хендлерах", ["handler"])
+
+DB_SECONDS = Histogram("bot_db_query_seconds", "Время метода Database (с ожиданием пула)",
+                       ["method"], buckets=BUCKETS)
+DB_ROWS = Histogram("bot_db_rows", "Строк вернул метод Database", ["method"], buckets=ROW_BUCKETS)
+DB_ERRORS = Counter("bot_db_errors_total", "Исключения в методах Database", ["method"])
+POOL_WAIT = Histogram("bot_db_pool_wait_seconds", "Ожидание свободного соединения в пуле", buckets=BUCKETS)
+POOL_SIZE = Gauge("bot_db_pool_connections", "Соединения в пуле", ["state"])
+DB_BROKEN = Counter("bot_db_broken_connections_total", "Сломанные соединения, найденные проверкой пула")
+
+API_SECONDS = Histogram("bot_api_request_seconds", "Время запроса к Bot API", ["method"], buckets=BUCKETS)
+API_RETRY_AFTER = Counter("bot_api_retry_after_total", "Ответы 429 (RetryAfter) от Bot API", ["method"])
+API_ERRORS = Counter("bot_api_errors_total", "Ошибки запросов к Bot API", ["method"])
+API_INLINED = Counter("bot_api_inlined_total", "Вызовы Bot API, отправленные ответом на вебхук", ["method"])
+
+
+class _Children(dict):
+    """Кеш labels(...) — у prometheus_client это поиск под блокировкой"""
+
+    def __init__(self, metric):
+        super().__init__()
+        self.metric = metric
+
+    def __missing__(self, key):
+        child = self[key] = self.metric.labels(key)
+        return child
+
+
+_handler_seconds = _Children(HANDLER_SECONDS)
+_handler_errors = _Children(HANDLER_ERRORS)
+_api_seconds = _Children(API_SECONDS)
+_api_retry_after = _Children(API_RETRY_AFTER)
+_api_errors = _Children(API_ERRORS)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время и ошибки по имени хендлера"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            _handler_errors[name].inc()
+            raise
+        finally:
+            _handler_seconds[name].observe(time.perf_counter() - t0)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время по методу Bot API и число RetryAfter"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        t0 = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            _api_retry_after[name].inc()
+            raise
+        except Exception:
+            _api_errors[name].inc()
+            raise
+        finally:
+            _api_seconds[name].observe(time.perf_counter() - t0)
+
+
+def _rows(result) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+def timed(name: str):
+    """Декоратор для async-методов Database: время, строки, ошибки"""
+    seconds, rows, errors = DB_SECONDS.labels(name), DB_ROWS.labels(name), DB_ERRORS.labels(name)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - t0)
+            rows.observe(_rows(result))
+            return result
+        return wrapper
+    return decorator
+
+
+class _Acquire:
+    __slots__ = ("pool", "timeout", "conn")
+
+    def __init__(self, pool, timeout):
+        self.pool = pool
+        self.timeout = timeout
+        self.conn = None
+
+    async def __aenter__(self):
+        t0 = time.perf_counter()
+        self.conn = await self.pool.acquire(timeout=self.timeout)
+        POOL_WAIT.observe(time.perf_counter() - t0)
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        await self.pool.release(self.conn)
+
+
+class TimedPool:
+    """Обёртка над asyncpg.Pool: pool.acquire() записывает время ожидания соединения"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        POOL_SIZE.labels("total").set_function(pool.get_size)
+        POOL_SIZE.labels("idle").set_function(pool.get_idle_size)
+
+    def acquire(self, *, timeout=None):
+        return _Acquire(self._pool, timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+def render() -> tuple:
+    """(тело, content-type) для ответа на /metrics"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class _Merged:
+    """Готовые семейства метрик для generate_latest"""
+
+    def __init__(self, families):
+        self.families = families
+
+    def collect(self):
+        return self.families
+
+
+def merge(parts: Dict[int, bytes]) -> bytes:
+    """Метрики нескольких воркеров одним ответом (WEB_WORKERS > 1): к каждому ряду
+    добавляется метка worker, так что счётчики разных процессов не смешиваются"""
+    families = {}
+    for worker, text in sorted(parts.items()):
+        for family in text_string_to_metric_families(text.decode()):
+            merged = families.get(family.name)
+            if merged is None:
+                merged = families[family.name] = Metric(family.name, family.documentation, family.type)
+            merged.samples.extend(s._replace(labels={**s.labels, "worker": str(worker)})
+                                  for s in family.samples)
+    return generate_latest(_Merged(list(families.values())))
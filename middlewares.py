@@ -0,0 +1,61 @@
+# middlewares.py
+import logging
+from typing import Any, Awaitable, Callable, Dict, TYPE_CHECKING
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from ratelimit import GCRALimiter
+
+if TYPE_CHECKING:
+    from activity import ActivityTracker
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Отбрасывает апдейты флудящих пользователей до хендлеров и запросов в БД"""
+
+    def __init__(self, limiter: GCRALimiter):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        allowed, warn = self.limiter.hit(user.id)
+        if allowed:
+            return await handler(event, data)
+        logger.debug(f"rate limited: {user.id}")
+        if warn:
+            try:
+                if event.callback_query:
+                    await event.callback_query.answer("Слишком часто. Подождите.")
+                elif event.message:
+                    await event.message.answer("Слишком часто. Подождите.")
+            except Exception:
+                pass
+        return None
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """Отмечает активность пользователя в буфере ActivityTracker (без запросов к БД)"""
+
+    def __init__(self, tracker: "ActivityTracker"):
+        self.tracker = tracker
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None:
+            self.tracker.touch(user.id)
+        return await handler(event, data)
@@ -0,0 +1,137 @@
+# migrate.py
+"""Версионные миграции схемы.
+
+Файлы migrations/NNNN_имя.sql применяются по порядку, каждый в своей
+транзакции; применённые версии и контрольные суммы хранятся
+в schema_migrations. При старте бот только сверяет версию схемы.
+
+    python migrate.py up       # применить новые миграции
+    python migrate.py verify   # проверить, что база в актуальной версии
+    python migrate.py status
+"""
+import os
+import re
+import sys
+import asyncio
+import hashlib
+import logging
+from typing import List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+LOCK_ID = 746762  # advisory lock на время применения миграции
+_NAME_RE = re.compile(r"^(\d+)_(.+)\.sql$")
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    checksum: str
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    result = []
+    for fname in sorted(os.listdir(directory)):
+        m = _NAME_RE.match(fname)
+        if not m:
+            continue
+        with open(os.path.join(directory, fname), encoding="utf-8") as f:
+            sql = f.read()
+        result.append(Migration(int(m.group(1)), m.group(2), sql, hashlib.sha256(sql.encode()).hexdigest()))
+    versions = [m.version for m in result]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError("Повторяющиеся номера миграций в " + directory)
+    return result
+
+
+async def _applied(conn) -> dict:
+    exists = await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not exists:
+        return {}
+    rows = await conn.fetch("SELECT version, checksum FROM schema_migrations")
+    return {r["version"]: r["checksum"] for r in rows}
+
+
+async def verify(conn) -> List[str]:
+    """Список расхождений между файлами миграций и базой (пустой — всё актуально)"""
+    applied = await _applied(conn)
+    problems = []
+    known = set()
+    for m in load_migrations():
+        known.add(m.version)
+        if m.version not in applied:
+            problems.append(f"не применена {m.version:04d}_{m.name}")
+        elif applied[m.version] != m.checksum:
+            problems.append(f"изменён файл уже применённой {m.version:04d}_{m.name}")
+    for v in sorted(set(applied) - known):
+        problems.append(f"в базе есть неизвестная миграция {v:04d}")
+    return problems
+
+
+async def upgrade(conn) -> int:
+    """Применяет недостающие миграции, возвращает их число"""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version INT PRIMARY KEY,
+            name TEXT,
+            checksum TEXT,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    # Блокировка на уровне транзакции, а не сессии: за транзакционным пулером
+    # pg_advisory_unlock может уйти на другое серверное соединение
+    count = 0
+    for m in load_migrations():
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", LOCK_ID)
+            # перечитываем под блокировкой: миграцию мог применить соседний процесс
+            if m.version in await _applied(conn):
+                continue
+            await conn.execute(m.sql)
+            await conn.execute(
+                "INSERT INTO schema_migrations(version, name, checksum) VALUES($1, $2, $3)",
+                m.version, m.name, m.checksum
+            )
+        logger.info(f"🧱 Применена миграция {m.version:04d}_{m.name}")
+        count += 1
+    return count
+
+
+async def ensure_current(conn):
+    """Проверка при старте: падаем с понятной ошибкой, если схема отстала"""
+    problems = await verify(conn)
+    if problems:
+        raise RuntimeError("❌ Схема БД не актуальна (" + "; ".join(problems) + "). Выполните: python migrate.py up")
+
+
+async def _main(argv):
+    import asyncpg
+    from config import DATABASE_URL
+    from db import SSL
+
+    if not argv or argv[0] not in ("up", "verify", "status"):
+        print(__doc__)
+        return 2
+    conn = await asyncpg.connect(DATABASE_URL, ssl=SSL)
+    try:
+        if argv[0] == "up":
+            n = await upgrade(conn)
+            print(f"Применено миграций: {n}")
+            return 0
+        if argv[0] == "status":
+            applied = await _applied(conn)
+            for m in load_migrations():
+                print(f"{m.version:04d}_{m.name}\t{'✅' if m.version in applied else '—'}")
+        problems = await verify(conn)
+        for p in problems:
+            print(p)
+        return 1 if problems else 0
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
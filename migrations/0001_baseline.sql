@@ -0,0 +1,89 @@
+-- 0001: исходная схема (раньше создавалась в Database.init)
+
+CREATE TABLE IF NOT EXISTS users(
+    user_id BIGINT PRIMARY KEY,
+    username TEXT,
+    name TEXT,
+    age INT,
+    bio TEXT,
+    photo_id TEXT,
+    step TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    last_active TIMESTAMP DEFAULT NOW(),
+    last_superlike TIMESTAMP,
+    superlike_extra INT DEFAULT 0,
+    superlike_extra_expires TIMESTAMP,
+    referrer BIGINT,
+    is_admin BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS likes(
+    liker BIGINT,
+    liked BIGINT,
+    type TEXT DEFAULT 'like',
+    created TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY(liker, liked)
+);
+
+CREATE TABLE IF NOT EXISTS views(
+    viewer BIGINT,
+    viewed BIGINT,
+    PRIMARY KEY(viewer, viewed)
+);
+
+CREATE TABLE IF NOT EXISTS matches(
+    id BIGSERIAL PRIMARY KEY,
+    user_a BIGINT,
+    user_b BIGINT,
+    created TIMESTAMP DEFAULT NOW(),
+    shown_to_a BOOLEAN DEFAULT FALSE,
+    shown_to_b BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS backups (
+    id BIGSERIAL PRIMARY KEY,
+    created TIMESTAMP DEFAULT NOW(),
+    users_json JSONB,
+    likes_json JSONB,
+    views_json JSONB
+);
+
+CREATE TABLE IF NOT EXISTS broadcasts(
+    id BIGSERIAL PRIMARY KEY,
+    admin_id BIGINT,
+    body TEXT,
+    created TIMESTAMP DEFAULT NOW(),
+    finished TIMESTAMP,
+    last_user_id BIGINT DEFAULT 0,
+    sent INT DEFAULT 0,
+    failed INT DEFAULT 0,
+    blocked INT DEFAULT 0
+);
+
+-- Реакция на анкету за один вызов: лайк + просмотр + мэтч.
+-- Advisory-lock на пару сериализует встречные лайки, поэтому два
+-- одновременных взаимных лайка не разминутся и не создадут два мэтча.
+CREATE OR REPLACE FUNCTION react(p_viewer BIGINT, p_target BIGINT, p_kind TEXT)
+RETURNS BIGINT LANGUAGE plpgsql AS $$
+DECLARE
+    v_match BIGINT;
+BEGIN
+    INSERT INTO views(viewer, viewed) VALUES (p_viewer, p_target) ON CONFLICT DO NOTHING;
+    IF p_kind = 'skip' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_advisory_xact_lock(hashtextextended(
+        LEAST(p_viewer, p_target)::text || ':' || GREATEST(p_viewer, p_target)::text, 0));
+    INSERT INTO likes(liker, liked, type) VALUES (p_viewer, p_target, p_kind) ON CONFLICT DO NOTHING;
+    IF NOT EXISTS (SELECT 1 FROM likes WHERE liker = p_target AND liked = p_viewer) THEN
+        RETURN NULL;
+    END IF;
+    SELECT id INTO v_match FROM matches
+    WHERE (user_a = p_viewer AND user_b = p_target) OR (user_a = p_target AND user_b = p_viewer)
+    ORDER BY id LIMIT 1;
+    IF v_match IS NULL THEN
+        INSERT INTO matches(user_a, user_b) VALUES (p_viewer, p_target) RETURNING id INTO v_match;
+    END IF;
+    RETURN v_match;
+END;
+$$;
@@ -0,0 +1,28 @@
+-- 0002: индексы под горячие запросы и уникальность пары в matches
+
+-- Дубли мэтчей могли остаться от гонки встречных лайков до react(): оставляем самый ранний
+DELETE FROM matches m USING matches d
+WHERE LEAST(m.user_a, m.user_b) = LEAST(d.user_a, d.user_b)
+  AND GREATEST(m.user_a, m.user_b) = GREATEST(d.user_a, d.user_b)
+  AND m.id > d.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS matches_pair_uniq
+    ON matches (LEAST(user_a, user_b), GREATEST(user_a, user_b));
+
+-- Мэтчи по каждой стороне: анти-джойн кандидатов, delete_user (OR раскладывается в BitmapOr)
+CREATE INDEX IF NOT EXISTS matches_user_a_idx ON matches (user_a) INCLUDE (user_b);
+CREATE INDEX IF NOT EXISTS matches_user_b_idx ON matches (user_b) INCLUDE (user_a);
+
+-- Непоказанные мэтчи (get_unshown_matches)
+CREATE INDEX IF NOT EXISTS matches_unshown_a_idx ON matches (user_a, created) WHERE NOT shown_to_a;
+CREATE INDEX IF NOT EXISTS matches_unshown_b_idx ON matches (user_b, created) WHERE NOT shown_to_b;
+
+-- Лайки по получателю: встречный лайк в react/exists_mutual, delete_user
+CREATE INDEX IF NOT EXISTS likes_liked_idx ON likes (liked, liker) INCLUDE (type);
+
+-- Просмотры по показанной анкете (PK (viewer, viewed) покрывает выборку по зрителю)
+CREATE INDEX IF NOT EXISTS views_viewed_idx ON views (viewed);
+
+-- Заполненные анкеты и неактивные пользователи
+CREATE INDEX IF NOT EXISTS users_done_idx ON users (user_id) WHERE step = 'done';
+CREATE INDEX IF NOT EXISTS users_last_active_idx ON users (last_active);
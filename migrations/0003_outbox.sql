@@ -0,0 +1,52 @@
+-- 0003: очередь уведомлений (outbox), пишется в одной транзакции с лайком/мэтчем
+
+CREATE TABLE IF NOT EXISTS outbox(
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt TIMESTAMP NOT NULL DEFAULT NOW(),
+    dead BOOLEAN NOT NULL DEFAULT FALSE,
+    last_error TEXT,
+    created TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS outbox_due_idx ON outbox (next_attempt) WHERE NOT dead;
+
+-- react() теперь сам ставит уведомление получателю в outbox
+DROP FUNCTION IF EXISTS react(BIGINT, BIGINT, TEXT);
+
+CREATE FUNCTION react(p_viewer BIGINT, p_target BIGINT, p_kind TEXT, p_name TEXT DEFAULT NULL)
+RETURNS BIGINT LANGUAGE plpgsql AS $$
+DECLARE
+    v_match BIGINT;
+BEGIN
+    INSERT INTO views(viewer, viewed) VALUES (p_viewer, p_target) ON CONFLICT DO NOTHING;
+    IF p_kind = 'skip' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_advisory_xact_lock(hashtextextended(
+        LEAST(p_viewer, p_target)::text || ':' || GREATEST(p_viewer, p_target)::text, 0));
+    INSERT INTO likes(liker, liked, type) VALUES (p_viewer, p_target, p_kind) ON CONFLICT DO NOTHING;
+    IF EXISTS (SELECT 1 FROM likes WHERE liker = p_target AND liked = p_viewer) THEN
+        SELECT id INTO v_match FROM matches
+        WHERE LEAST(user_a, user_b) = LEAST(p_viewer, p_target)
+          AND GREATEST(user_a, user_b) = GREATEST(p_viewer, p_target);
+        IF v_match IS NULL THEN
+            INSERT INTO matches(user_a, user_b) VALUES (p_viewer, p_target) RETURNING id INTO v_match;
+        END IF;
+    END IF;
+
+    IF v_match IS NOT NULL THEN
+        INSERT INTO outbox(chat_id, kind, payload) VALUES (
+            p_target,
+            CASE WHEN p_kind = 'superlike' THEN 'superlike_match' ELSE 'match' END,
+            jsonb_build_object('match_id', v_match, 'from', p_viewer, 'name', p_name));
+    ELSIF p_kind = 'superlike' THEN
+        INSERT INTO outbox(chat_id, kind, payload) VALUES (
+            p_target, 'superlike', jsonb_build_object('from', p_viewer, 'name', p_name));
+    END IF;
+    RETURN v_match;
+END;
+$$;
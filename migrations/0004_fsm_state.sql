@@ -0,0 +1,10 @@
+-- 0004: состояния FSM (регистрация, редактирование), переживают рестарты
+
+CREATE TABLE IF NOT EXISTS fsm_state(
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}',
+    updated TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS fsm_state_updated_idx ON fsm_state (updated);
@@ -0,0 +1,54 @@
+-- 0005: агрегаты для /admin в материализованных представлениях
+-- Обновляются через refresh_stats() не чаще STATS_REFRESH_SEC, /admin читает готовые строки
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS stats_daily AS
+SELECT d.day,
+       COALESCE(r.n, 0) AS registrations,
+       COALESCE(l.likes, 0) AS likes,
+       COALESCE(l.superlikes, 0) AS superlikes,
+       COALESCE(m.n, 0) AS matches
+FROM (
+    SELECT created_at::date AS day FROM users WHERE created_at IS NOT NULL
+    UNION SELECT created::date FROM likes WHERE created IS NOT NULL
+    UNION SELECT created::date FROM matches WHERE created IS NOT NULL
+) d
+LEFT JOIN (
+    SELECT created_at::date AS day, count(*) AS n FROM users GROUP BY 1
+) r ON r.day = d.day
+LEFT JOIN (
+    SELECT created::date AS day,
+           count(*) FILTER (WHERE type <> 'superlike') AS likes,
+           count(*) FILTER (WHERE type = 'superlike') AS superlikes
+    FROM likes GROUP BY 1
+) l ON l.day = d.day
+LEFT JOIN (
+    SELECT created::date AS day, count(*) AS n FROM matches GROUP BY 1
+) m ON m.day = d.day;
+
+CREATE UNIQUE INDEX IF NOT EXISTS stats_daily_day_idx ON stats_daily (day);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS stats_totals AS
+SELECT 1 AS id,
+       (SELECT count(*) FROM users) AS users,
+       (SELECT count(*) FROM users WHERE step = 'done') AS profiles,
+       (SELECT count(*) FROM users WHERE last_active > LOCALTIMESTAMP - INTERVAL '24 hours') AS active_24h,
+       (SELECT count(*) FROM users WHERE last_active > LOCALTIMESTAMP - INTERVAL '7 days') AS active_7d,
+       (SELECT count(*) FROM likes WHERE type <> 'superlike') AS likes,
+       (SELECT count(*) FROM likes WHERE type = 'superlike') AS superlikes,
+       (SELECT count(*) FROM matches) AS matches,
+       LOCALTIMESTAMP AS refreshed;
+
+CREATE UNIQUE INDEX IF NOT EXISTS stats_totals_id_idx ON stats_totals (id);
+
+-- Обновление из любого процесса: параллельный вызов не ждёт, а сразу возвращает FALSE
+CREATE OR REPLACE FUNCTION refresh_stats() RETURNS BOOLEAN
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtextextended('refresh_stats', 0)) THEN
+        RETURN FALSE;
+    END IF;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY stats_daily;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY stats_totals;
+    RETURN TRUE;
+END;
+$$;
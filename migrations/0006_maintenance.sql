@@ -0,0 +1,12 @@
+-- 0006: фоновые задачи обслуживания (чистка неактивных и осиротевших строк)
+-- Строка на задачу: аренда, чтобы из нескольких процессов работал один, и отчёт последнего запуска
+
+CREATE TABLE IF NOT EXISTS maintenance(
+    job TEXT PRIMARY KEY,
+    started TIMESTAMP,
+    finished TIMESTAMP,
+    lease_until TIMESTAMP,
+    report JSONB
+);
+
+INSERT INTO maintenance(job) VALUES ('cleanup') ON CONFLICT DO NOTHING;
@@ -0,0 +1,109 @@
+-- 0007: просмотренные анкеты — одна строка на зрителя вместо строки на пару (views)
+-- ids отсортирован, days[i] — день последнего показа ids[i] (номер дня от 2020-01-01)
+
+CREATE TABLE IF NOT EXISTS seen(
+    viewer BIGINT PRIMARY KEY,
+    ids BIGINT[] NOT NULL DEFAULT '{}',
+    days INT[] NOT NULL DEFAULT '{}',
+    updated TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION seen_today() RETURNS INT
+LANGUAGE sql STABLE AS $$
+    SELECT CURRENT_DATE - DATE '2020-01-01'
+$$;
+
+-- Добавляет просмотры пачкой: слияние с уже сохранёнными, у повторов обновляется день
+CREATE OR REPLACE FUNCTION seen_add(p_viewer BIGINT, p_ids BIGINT[]) RETURNS VOID
+LANGUAGE sql AS $$
+    INSERT INTO seen AS s (viewer, ids, days)
+    SELECT p_viewer, array_agg(id ORDER BY id), array_agg(seen_today())
+    FROM (SELECT DISTINCT unnest(p_ids) AS id) t
+    ON CONFLICT (viewer) DO UPDATE SET (ids, days, updated) = (
+        SELECT array_agg(m.id ORDER BY m.id), array_agg(m.day ORDER BY m.id), NOW()
+        FROM (
+            SELECT id, max(day) AS day
+            FROM (
+                SELECT * FROM unnest(s.ids, s.days) AS o(id, day)
+                UNION ALL
+                SELECT * FROM unnest(EXCLUDED.ids, EXCLUDED.days)
+            ) u
+            GROUP BY id
+        ) m
+    )
+$$;
+
+-- Просмотренные зрителем за последние p_decay_days дней (0 — за всё время),
+-- для исключения кандидатов: user_id NOT IN (SELECT seen_ids(...))
+CREATE OR REPLACE FUNCTION seen_ids(p_viewer BIGINT, p_decay_days INT DEFAULT 0) RETURNS SETOF BIGINT
+LANGUAGE sql STABLE AS $$
+    SELECT o.id
+    FROM seen s, unnest(s.ids, s.days) AS o(id, day)
+    WHERE s.viewer = p_viewer
+      AND (p_decay_days <= 0 OR o.day > seen_today() - p_decay_days)
+$$;
+
+-- Оставляет только показанные за последние p_keep_days дней; возвращает, сколько забыто
+CREATE OR REPLACE FUNCTION seen_forget(p_viewer BIGINT, p_keep_days INT) RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_before INT;
+    v_after INT;
+BEGIN
+    SELECT cardinality(ids) INTO v_before FROM seen WHERE viewer = p_viewer FOR UPDATE;
+    IF v_before IS NULL THEN
+        RETURN 0;
+    END IF;
+    UPDATE seen s SET (ids, days, updated) = (
+        SELECT COALESCE(array_agg(o.id ORDER BY o.id), '{}'), COALESCE(array_agg(o.day ORDER BY o.id), '{}'), NOW()
+        FROM unnest(s.ids, s.days) AS o(id, day)
+        WHERE o.day > seen_today() - p_keep_days
+    )
+    WHERE viewer = p_viewer
+    RETURNING cardinality(ids) INTO v_after;
+    RETURN v_before - v_after;
+END;
+$$;
+
+-- Перенос истории из views: дат показа там нет, считаем всё показанным сегодня
+INSERT INTO seen(viewer, ids, days)
+SELECT viewer, array_agg(viewed ORDER BY viewed), array_fill(seen_today(), ARRAY[count(*)::int])
+FROM views
+GROUP BY viewer
+ON CONFLICT (viewer) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION react(p_viewer BIGINT, p_target BIGINT, p_kind TEXT, p_name TEXT DEFAULT NULL)
+RETURNS BIGINT LANGUAGE plpgsql AS $$
+DECLARE
+    v_match BIGINT;
+BEGIN
+    PERFORM seen_add(p_viewer, ARRAY[p_target]);
+    IF p_kind = 'skip' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_advisory_xact_lock(hashtextextended(
+        LEAST(p_viewer, p_target)::text || ':' || GREATEST(p_viewer, p_target)::text, 0));
+    INSERT INTO likes(liker, liked, type) VALUES (p_viewer, p_target, p_kind) ON CONFLICT DO NOTHING;
+    IF EXISTS (SELECT 1 FROM likes WHERE liker = p_target AND liked = p_viewer) THEN
+        SELECT id INTO v_match FROM matches
+        WHERE LEAST(user_a, user_b) = LEAST(p_viewer, p_target)
+          AND GREATEST(user_a, user_b) = GREATEST(p_viewer, p_target);
+        IF v_match IS NULL THEN
+            INSERT INTO matches(user_a, user_b) VALUES (p_viewer, p_target) RETURNING id INTO v_match;
+        END IF;
+    END IF;
+
+    IF v_match IS NOT NULL THEN
+        INSERT INTO outbox(chat_id, kind, payload) VALUES (
+            p_target,
+            CASE WHEN p_kind = 'superlike' THEN 'superlike_match' ELSE 'match' END,
+            jsonb_build_object('match_id', v_match, 'from', p_viewer, 'name', p_name));
+    ELSIF p_kind = 'superlike' THEN
+        INSERT INTO outbox(chat_id, kind, payload) VALUES (
+            p_target, 'superlike', jsonb_build_object('from', p_viewer, 'name', p_name));
+    END IF;
+    RETURN v_match;
+END;
+$$;
+
+DROP TABLE views;
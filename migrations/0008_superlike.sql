@@ -0,0 +1,9 @@
+-- 0008: квота суперлайков считается в SQL — проверка для кнопки и списание одним UPDATE
+
+-- Доступен ли суперлайк: действующий реферальный бонус или прошёл кулдаун после последнего
+CREATE OR REPLACE FUNCTION superlike_ready(u users, p_cooldown_sec INT) RETURNS BOOLEAN
+LANGUAGE sql STABLE AS $$
+    SELECT (COALESCE(u.superlike_extra, 0) > 0 AND u.superlike_extra_expires > NOW())
+        OR u.last_superlike IS NULL
+        OR u.last_superlike < NOW() - make_interval(secs => p_cooldown_sec)
+$$;
@@ -0,0 +1,5 @@
+-- 0009: время последнего изменения строки users — метка для дельта-бэкапов
+-- (правки анкеты и регистрация не трогают last_active). Существующие строки
+-- получают время миграции, поэтому первая дельта после неё содержит всех пользователей
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS updated TIMESTAMPTZ NOT NULL DEFAULT NOW();
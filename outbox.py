@@ -0,0 +1,124 @@
+# outbox.py
+import json
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import OUTBOX_BATCH, OUTBOX_CONCURRENCY, OUTBOX_POLL_SEC, OUTBOX_MAX_ATTEMPTS, OUTBOX_LEASE_SEC
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 3600
+
+
+def render(kind: str, payload: dict):
+    """Текст и клавиатура уведомления по записи outbox"""
+    name = payload.get("name")
+    if kind == "match":
+        text = "💌 Вам поставили симпатию! Нажмите, чтобы посмотреть."
+    elif kind == "superlike_match":
+        text = f"🌟 Вас выбрали! @{name} использовал(а) Суперлайк!"
+    elif kind == "superlike":
+        text = f"🌟 У вас суперлайк от @{name}! Нажмите, чтобы посмотреть."
+    else:
+        raise ValueError(f"unknown outbox kind: {kind}")
+    callback = f"viewmatch:{payload['match_id']}" if payload.get("match_id") else "noop"
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="👀 Посмотреть", callback_data=callback)]
+    ])
+    return text, kb
+
+
+class OutboxDispatcher:
+    """Фоновая доставка уведомлений из таблицы outbox.
+
+    Забирает пачку записей (с арендой, чтобы несколько процессов не
+    отправили одно и то же), шлёт их параллельно, удачные удаляет,
+    неудачные откладывает с экспоненциальной задержкой, а после
+    OUTBOX_MAX_ATTEMPTS попыток помечает как dead.
+    """
+
+    def __init__(self, db, bot: Bot, batch: int = OUTBOX_BATCH, concurrency: int = OUTBOX_CONCURRENCY,
+                 poll: float = OUTBOX_POLL_SEC, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.db = db
+        self.bot = bot
+        self.batch = batch
+        self.poll = poll
+        self.max_attempts = max_attempts
+        self._sem = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    def wake(self):
+        """Сигнал, что в outbox появились записи — не ждать следующего опроса"""
+        self._wake.set()
+
+    async def drain_woken(self) -> int:
+        """Разбор без фонового цикла (serverless): одна пачка, если с прошлого раза был wake()"""
+        if not self._wake.is_set():
+            return 0
+        self._wake.clear()
+        return await self.drain_once()
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                n = await self.drain_once()
+            except Exception:
+                logger.exception("outbox drain failed")
+                n = 0
+            if n >= self.batch:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def drain_once(self) -> int:
+        rows = await self.db.outbox_claim(self.batch, OUTBOX_LEASE_SEC)
+        if not rows:
+            return 0
+        done, retry, dead = [], [], []
+        for row, (status, delay, error) in zip(rows, await asyncio.gather(*(self._deliver(r) for r in rows))):
+            if status == "ok":
+                done.append(row["id"])
+            elif status == "flood":
+                # 429 — не ошибка доставки: переносим на retry_after, попытку не тратим
+                retry.append((row["id"], delay, error, 0))
+            elif status == "dead" or row["attempts"] + 1 >= self.max_attempts:
+                dead.append((row["id"], error))
+            else:
+                retry.append((row["id"], delay, error, 1))
+        await self.db.outbox_complete(done, retry, dead)
+        if dead:
+            logger.warning(f"📭 {len(dead)} уведомлений не доставлено (dead)")
+        return len(rows)
+
+    async def _deliver(self, row):
+        async with self._sem:
+            try:
+                text, kb = render(row["kind"], json.loads(row["payload"]))
+                await self.bot.send_message(row["chat_id"], text, reply_markup=kb)
+                return "ok", 0, None
+            except TelegramRetryAfter as e:
+                return "flood", e.retry_after, str(e)
+            except (TelegramForbiddenError, TelegramBadRequest, ValueError) as e:
+                return "dead", 0, str(e)
+            except Exception as e:
+                return "retry", min(2 ** row["attempts"], MAX_BACKOFF), str(e)
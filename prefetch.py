@@ -0,0 +1,99 @@
+# prefetch.py
+import asyncio
+import logging
+from collections import deque
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Ссылки на фоновые задачи, чтобы их не собрал GC
+_tasks = set()
+
+
+class _ViewerQueue:
+    __slots__ = ("rows", "current", "refill", "dropped")
+
+    def __init__(self):
+        self.rows = deque()
+        self.current = None     # анкета, которая сейчас на экране
+        self.refill = None      # задача фоновой дозагрузки
+        self.dropped = None     # отброшенные во время дозагрузки
+
+
+class ProfilePrefetcher:
+    """Очередь заранее выбранных анкет для каждого зрителя.
+
+    Кандидаты берутся пачкой и отдаются по одной; когда в очереди
+    остаётся мало анкет, дозагрузка идёт в фоне. Источник пачек —
+    source(viewer, limit, exclude), по умолчанию db.get_next_profiles.
+    """
+
+    def __init__(self, db, batch_size: int = 20, low_watermark: int = 5,
+                 max_viewers: int = 1000, ttl: int = 300, source=None):
+        self.db = db
+        self.source = source or db.get_next_profiles
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self._queues = TTLCache(maxsize=max_viewers, ttl=ttl)
+
+    def _queue(self, viewer: int) -> _ViewerQueue:
+        q = self._queues.get(viewer)
+        if q is None:
+            q = _ViewerQueue()
+            self._queues[viewer] = q
+        return q
+
+    async def next(self, viewer: int):
+        """Следующая анкета для зрителя или None, если кандидатов нет"""
+        q = self._queue(viewer)
+        if not q.rows:
+            if q.refill:
+                await asyncio.shield(q.refill)
+            else:
+                await self._fill(viewer, q)
+        if not q.rows:
+            return None
+        row = q.rows.popleft()
+        q.current = row["user_id"]
+        if len(q.rows) <= self.low_watermark and not q.refill:
+            self._schedule_refill(viewer, q)
+        return row
+
+    def discard(self, viewer: int, target: int):
+        """Убирает target из очереди viewer (лайк, пропуск, мэтч)"""
+        q = self._queues.get(viewer)
+        if q is None:
+            return
+        if q.current == target:
+            q.current = None
+        if q.dropped is not None:
+            q.dropped.add(target)
+        for row in q.rows:
+            if row["user_id"] == target:
+                q.rows.remove(row)
+                break
+
+    def forget(self, viewer: int):
+        self._queues.pop(viewer, None)
+
+    def _schedule_refill(self, viewer: int, q: _ViewerQueue):
+        task = asyncio.create_task(self._fill(viewer, q))
+        q.refill = task
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    async def _fill(self, viewer: int, q: _ViewerQueue):
+        exclude = [r["user_id"] for r in q.rows]
+        if q.current:
+            exclude.append(q.current)
+        q.dropped = set()
+        try:
+            rows = await self.source(viewer, self.batch_size, exclude)
+            present = set(exclude) | q.dropped
+            q.rows.extend(r for r in rows if r["user_id"] not in present)
+        except Exception:
+            logger.exception("prefetch failed for %s", viewer)
+        finally:
+            q.dropped = None
+            q.refill = None
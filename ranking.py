@@ -0,0 +1,255 @@
+# ranking.py
+import time
+import asyncio
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from config import (RANK_W_AGE, RANK_W_ACTIVE, RANK_W_LIKED, RANK_W_POPULAR, RANK_FLOOR,
+                    RANK_AGE_SCALE, RANK_ACTIVE_DAYS, RANKING_RELOAD_SEC)
+
+logger = logging.getLogger(__name__)
+
+AGE_TABLE = 128     # таблица весов близости возраста; возраст больше не бывает
+BASE_TTL = 60       # сек между пересчётами части веса, не зависящей от зрителя
+
+
+class CandidatePool:
+    """Заполненные анкеты в массивах NumPy: id, возраст, последняя активность, полученные лайки.
+
+    base — часть веса, не зависящая от зрителя (активность, популярность);
+    её пересчитывает RankingEngine. Слот пользователя ищется по словарю,
+    удаление — перестановкой с последним.
+    """
+
+    COLUMNS = (("ids", np.int64), ("age", np.intp), ("active", np.float64),
+               ("likes", np.float32), ("base", np.float32))
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self._slot = {}
+        self._alloc(capacity)
+
+    def _alloc(self, capacity: int):
+        n = self.size
+        for name, dtype in self.COLUMNS:
+            old = getattr(self, name, None)
+            arr = np.zeros(capacity, dtype=dtype)
+            if n:
+                arr[:n] = old[:n]
+            setattr(self, name, arr)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, user_id: int):
+        return user_id in self._slot
+
+    def load(self, ids, age, active, likes):
+        """Полная замена содержимого (периодическая перезагрузка из базы)"""
+        n = len(ids)
+        self.size = 0
+        self._alloc(max(1024, n + n // 4))
+        self.ids[:n], self.active[:n], self.likes[:n] = ids, active, likes
+        self.age[:n] = np.clip(age, 0, AGE_TABLE - 1)
+        self.size = n
+        self._slot = {uid: i for i, uid in enumerate(self.ids[:n].tolist())}
+
+    def upsert(self, user_id: int, age: Optional[int], active: float) -> int:
+        i = self._slot.get(user_id)
+        if i is None:
+            if self.size == len(self.ids):
+                self._alloc(len(self.ids) * 2)
+            i = self._slot[user_id] = self.size
+            self.size += 1
+            self.ids[i] = user_id
+            self.likes[i] = 0
+        self.age[i] = min(max(age or 0, 0), AGE_TABLE - 1)
+        self.active[i] = active
+        return i
+
+    def remove(self, user_id: int):
+        i = self._slot.pop(user_id, None)
+        if i is None:
+            return
+        last = self.size - 1
+        if i != last:
+            for name, _ in self.COLUMNS:
+                arr = getattr(self, name)
+                arr[i] = arr[last]
+            self._slot[int(self.ids[i])] = i
+        self.size = last
+
+    def slot(self, user_id: int) -> Optional[int]:
+        return self._slot.get(user_id)
+
+    def slots(self, user_ids) -> List[int]:
+        get = self._slot.get
+        return [i for i in map(get, user_ids) if i is not None]
+
+
+class RankingEngine:
+    """Выбор кандидатов по весам вместо ORDER BY random().
+
+    Для зрителя одной векторной операцией считается вес каждой анкеты пула:
+    близость возраста, свежесть активности, лайкнул ли кандидат зрителя
+    и (слабо) популярность. Затем выборка без повторов пропорционально весу
+    (ключи Гумбеля + argpartition), так что анкеты с малым весом тоже
+    попадаются, но реже.
+
+    Пул обновляется из хендлеров (регистрация, правка возраста, лайки,
+    активность) и целиком перечитывается раз в RANKING_RELOAD_SEC, чтобы
+    подхватить изменения других процессов и удаления.
+    """
+
+    def __init__(self, db, reload_sec: float = RANKING_RELOAD_SEC, seed: Optional[int] = None):
+        self.db = db
+        self.pool = CandidatePool()
+        self.reload_sec = reload_sec
+        self.loaded = False
+        self._rng = np.random.default_rng(seed)
+        self._base_at = 0.0
+        self._pop_norm = 1.0
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._stop.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    async def _loop(self):
+        while not self._stop.is_set():
+            try:
+                await self.reload()
+            except Exception:
+                logger.exception("ranking reload failed")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.reload_sec)
+            except asyncio.TimeoutError:
+                pass
+
+    async def reload(self):
+        t0 = time.perf_counter()
+        ids, age, active, likes = await self.db.ranking_snapshot()
+        self.pool.load(ids, age, active, likes)
+        self._refresh_base(time.time())
+        self.loaded = True
+        logger.info(f"🎯 Пул анкет загружен: {len(self.pool)} за {time.perf_counter() - t0:.2f} с")
+
+    def _base(self, active, likes, now: float):
+        idle_days = np.maximum(now - active, 0) / 86400
+        return (RANK_FLOOR + RANK_W_ACTIVE * np.exp(-idle_days / RANK_ACTIVE_DAYS)
+                + RANK_W_POPULAR * np.log1p(likes) / self._pop_norm)
+
+    def _refresh_base(self, now: float):
+        """Пересчёт части веса, не зависящей от зрителя; свежесть меняется медленно, хватает раза в минуту"""
+        pool, n = self.pool, self.pool.size
+        if n:
+            self._pop_norm = 1 + float(np.log1p(pool.likes[:n].max()))
+            pool.base[:n] = self._base(pool.active[:n], pool.likes[:n], now)
+        self._base_at = now
+
+    def _rescore(self, i: Optional[int]):
+        if i is not None:
+            pool = self.pool
+            pool.base[i] = self._base(pool.active[i], pool.likes[i], time.time())
+
+    # === обновления из хендлеров ===
+    def profile_done(self, user_id: int, age: Optional[int]):
+        self._rescore(self.pool.upsert(user_id, age, time.time()))
+
+    def touch(self, user_id: int):
+        i = self.pool.slot(user_id)
+        if i is not None:
+            self.pool.active[i] = time.time()
+            self._rescore(i)
+
+    def set_age(self, user_id: int, age: int):
+        i = self.pool.slot(user_id)
+        if i is not None:
+            self.pool.age[i] = min(max(age, 0), AGE_TABLE - 1)
+
+    def liked(self, user_id: int):
+        i = self.pool.slot(user_id)
+        if i is not None:
+            self.pool.likes[i] += 1
+            self._rescore(i)
+
+    def remove(self, user_id: int):
+        self.pool.remove(user_id)
+
+    # === выбор ===
+    def rank(self, viewer_age: Optional[int], exclude, likers, limit: int, now: float = None) -> np.ndarray:
+        """id до limit кандидатов, выбранных пропорционально весу (без исключённых)"""
+        pool = self.pool
+        n = pool.size
+        if not n:
+            return pool.ids[:0]
+        now = time.time() if now is None else now
+        if now - self._base_at > BASE_TTL:
+            self._refresh_base(now)
+        if viewer_age:
+            # возраст — небольшое целое, вес близости берётся из таблицы, а не exp() по всему пулу
+            table = np.exp(-np.abs(np.arange(AGE_TABLE, dtype=np.float32) - viewer_age) / RANK_AGE_SCALE)
+            score = np.take(table * RANK_W_AGE, pool.age[:n])
+            score += pool.base[:n]
+        else:
+            score = pool.base[:n].copy()
+        liked_me = pool.slots(likers)
+        if liked_me:
+            score[liked_me] += RANK_W_LIKED
+        banned = pool.slots(exclude)
+        if banned:
+            score[banned] = 0
+        k = min(limit, n - len(set(banned)))
+        if k <= 0:
+            return pool.ids[:0]
+        return pool.ids[self._sample(score, k)]
+
+    def _sample(self, score: np.ndarray, k: int) -> List[int]:
+        """k разных индексов с вероятностью ∝ score.
+
+        Броски по накопленной сумме весов (повторы отбрасываются) — дешевле
+        сортировки ключей на всём пуле; если повторов слишком много
+        (маленький пул, один вес доминирует), остаток добирается точно.
+        """
+        cs = np.cumsum(score)
+        total = float(cs[-1])
+        chosen = {}
+        for _ in range(4):
+            picks = np.searchsorted(cs, self._rng.random(2 * k) * total, side="right")
+            for i in np.minimum(picks, len(cs) - 1).tolist():
+                chosen[i] = None
+                if len(chosen) == k:
+                    return list(chosen)
+        rest = score.copy()
+        rest[list(chosen)] = 0
+        with np.errstate(divide="ignore"):
+            keys = self._rng.standard_exponential(len(rest)) / rest
+        need = k - len(chosen)
+        top = np.argpartition(keys, need - 1)[:need]
+        return list(chosen) + top[np.argsort(keys[top])].tolist()
+
+    async def next_profiles(self, viewer: int, limit: int, exclude: Optional[List[int]] = None):
+        """Пачка анкет для зрителя; та же сигнатура, что у Database.get_next_profiles"""
+        if not self.loaded:
+            return await self.db.get_next_profiles(viewer, limit, exclude)
+        ctx = await self.db.ranking_context(viewer)
+        banned = list(ctx["excluded"])
+        banned.append(viewer)
+        if exclude:
+            banned.extend(exclude)
+        ids = self.rank(ctx["age"], banned, ctx["likers"], limit)
+        if not len(ids):
+            return []
+        rows = await self.db.get_profiles(ids.tolist(), viewer)
+        by_id = {r["user_id"]: r for r in rows}
+        # удалённые в другом процессе анкеты просто не вернутся из базы
+        return [by_id[i] for i in ids.tolist() if i in by_id]
@@ -0,0 +1,51 @@
+# ratelimit.py
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+
+class GCRALimiter:
+    """Лимит «limit событий за period секунд» на ключ (GCRA).
+
+    На ключ хранится одно число — теоретическое время прихода (TAT),
+    проверка O(1). Ключи, чей TAT уже в прошлом, ничем не отличаются
+    от отсутствующих и вытесняются при следующих проверках.
+    """
+
+    def __init__(self, limit: int, period: float, max_keys: int = 100_000):
+        self.interval = period / limit
+        self.tolerance = period - self.interval  # всплеск до limit событий подряд
+        self.max_keys = max_keys
+        self._keys = OrderedDict()  # key -> [tat, warned]
+
+    def hit(self, key, now: float = None) -> Tuple[bool, bool]:
+        """Возвращает (разрешено, нужно ли предупредить) — предупреждаем один раз за серию отказов"""
+        if now is None:
+            now = time.monotonic()
+        self._evict(now)
+        rec = self._keys.get(key)
+        tat = max(rec[0], now) if rec else now
+        if tat - now > self.tolerance:
+            warn = not rec[1]
+            rec[1] = True
+            return False, warn
+        if rec:
+            rec[0] = tat + self.interval
+            rec[1] = False
+            self._keys.move_to_end(key)
+        else:
+            self._keys[key] = [tat + self.interval, False]
+        return True, False
+
+    def _evict(self, now: float):
+        # пара шагов на вызов держит размер словаря около числа активных ключей
+        for _ in range(2):
+            if not self._keys:
+                return
+            key, rec = next(iter(self._keys.items()))
+            if rec[0] > now and len(self._keys) <= self.max_keys:
+                return
+            del self._keys[key]
+
+    def __len__(self):
+        return len(self._keys)
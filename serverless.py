@@ -0,0 +1,187 @@
+# serverless.py
+"""ASGI-приложение для Vercel (точка входа — api/webhook.py).
+
+При импорте грузится только config: пул БД, хендлеры, FSM-хранилище
+и проверка версии схемы поднимаются один раз на инстанс, при первом
+апдейте (ensure_started). Вебхук ставится, только если getWebhookInfo
+показывает другой адрес.
+
+Инстанс замораживается сразу после ответа, поэтому фоновых задач здесь
+нет: буферы FSM и last_active сбрасываются до ответа, уведомления из outbox
+отправляются тем же вызовом. Последний вызов Bot API апдейта может уйти
+телом ответа (WEBHOOK_REPLY, см. webhook_reply.py). Рассылки, ночная
+чистка и ранжирование работают только в долгоживущем bot.py: /admin
+message отвечает отказом, статистика пересчитывается до ответа.
+
+Инстансов может быть несколько одновременно, и кеши одного процесса
+другие не инвалидируют. Поэтому кеша записей users нет, а FSM всегда
+в Postgres без LRU-слоя: состояние читается из базы на каждом апдейте
+и записывается до ответа. Лимит частоты (GCRA) считается на инстанс.
+
+Локально: uvicorn serverless:app --port 8080
+"""
+import json
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from config import TELEGRAM_TOKEN, WEBHOOK_URL, DATABASE_URL, TELEGRAM_API_URL, WEBHOOK_REPLY
+from config import SERVERLESS_POOL_MIN, SERVERLESS_POOL_MAX
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/api/webhook"
+
+
+async def ensure_webhook(bot, url: str) -> bool:
+    """setWebhook, только если Telegram знает другой адрес; True — адрес поменялся"""
+    info = await bot.get_webhook_info()
+    if info.url == url:
+        logger.info(f"✅ Вебхук уже установлен: {url}")
+        return False
+    await bot.set_webhook(url=url)
+    logger.info(f"✅ Вебхук установлен: {url}")
+    return True
+
+
+class LazyBot:
+    """Бот одного serverless-инстанса: всё создаётся при первом апдейте"""
+
+    def __init__(self):
+        self.bot = None
+        self.dp = None
+        self.db = None
+        self.storage = None
+        self.outbox = None
+        self.activity = None
+        self.started_in = None  # сек на инициализацию, для логов и bench/cold_start.py
+        self._lock = asyncio.Lock()
+
+    async def ensure_started(self):
+        if self.dp is not None:
+            return
+        async with self._lock:
+            if self.dp is not None:
+                return
+            if not (TELEGRAM_TOKEN and DATABASE_URL and WEBHOOK_URL):
+                raise ValueError("❌ TELEGRAM_TOKEN, DATABASE_URL и WEBHOOK_URL должны быть заданы")
+            t0 = time.perf_counter()
+            # тяжёлые модули (aiogram, asyncpg, хендлеры) грузятся здесь, а не при импорте
+            from aiogram import Bot, Dispatcher
+            from aiogram.client.session.aiohttp import AiohttpSession
+            from aiogram.client.telegram import TelegramAPIServer
+            from db import Database
+            from handlers import register_handlers
+            from outbox import OutboxDispatcher
+            from broadcast import NoBroadcaster
+            from fsm_storage import PgStorage
+            from activity import ActivityTracker
+            from webhook_reply import ReplyCollector
+            import metrics
+
+            db = Database(user_cache=False, background=False)
+            session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+            bot = Bot(token=TELEGRAM_TOKEN, session=session)
+            if WEBHOOK_REPLY:
+                bot.session.middleware(ReplyCollector())
+            bot.session.middleware(metrics.RequestMetricsMiddleware())
+            # FSM_STORAGE=memory здесь не годится: следующий апдейт может попасть в другой инстанс
+            storage = PgStorage(db, max_entries=0)
+            dp = Dispatcher(storage=storage)
+            outbox = OutboxDispatcher(db, bot)
+            activity = ActivityTracker(db)
+
+            # пул и getWebhookInfo — два сетевых ожидания, делаем их одновременно
+            await asyncio.gather(db.init(min_size=SERVERLESS_POOL_MIN, max_size=SERVERLESS_POOL_MAX),
+                                 ensure_webhook(bot, WEBHOOK_URL))
+            await register_handlers(dp, db, bot, broadcast=NoBroadcaster(), notifier=outbox,
+                                    activity=activity, prefetch=False)
+
+            self.bot, self.db, self.storage, self.outbox, self.activity = bot, db, storage, outbox, activity
+            self.dp = dp
+            self.started_in = time.perf_counter() - t0
+            logger.info(f"⚡ Инстанс готов за {self.started_in:.2f} с")
+
+    async def feed(self, update: dict) -> Optional[bytes]:
+        """Обрабатывает апдейт; возвращает тело ответа на вебхук (см. webhook_reply.py)"""
+        await self.ensure_started()
+        body = None
+        if WEBHOOK_REPLY:
+            from webhook_reply import WebhookReply
+            async with WebhookReply() as reply:
+                await self.dp.feed_webhook_update(self.bot, update)
+            body = reply.body()
+        else:
+            await self.dp.feed_webhook_update(self.bot, update)
+        # после ответа инстанс может быть заморожен или убит — всё отложенное доделываем сейчас
+        await asyncio.gather(self.activity.flush(), self.storage.flush())
+        await self.outbox.drain_woken()
+        return body
+
+    async def close(self):
+        if self.dp is None:
+            return
+        await self.storage.close()
+        await self.activity.flush()
+        await self.bot.session.close()
+        await self.db.close()
+
+
+lazy = LazyBot()
+
+
+async def _respond(send, status: int, body: bytes = b""):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # ничего не поднимаем: инициализация — при первом апдейте
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            try:
+                await lazy.close()
+            except Exception:
+                logger.exception("shutdown failed")
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI: POST /api/webhook — апдейт Telegram, GET /api/webhook — проверка живости"""
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    if scope["path"] != WEBHOOK_PATH:
+        return await _respond(send, 404)
+    if scope["method"] == "GET":
+        return await _respond(send, 200, b'{"ok":true}')
+    headers = dict(scope.get("headers") or [])
+    if scope["method"] != "POST" or not headers.get(b"content-type", b"").startswith(b"application/json"):
+        return await _respond(send, 403)
+    try:
+        update = json.loads(await _read_body(receive))
+    except ValueError:
+        return await _respond(send, 400)
+    try:
+        body = await lazy.feed(update)
+    except Exception:
+        # как и aiohttp в bot.py: 500, Telegram повторит апдейт
+        logger.exception("update failed")
+        return await _respond(send, 500)
+    await _respond(send, 200, body or b'{"ok":true}')
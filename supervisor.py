@@ -0,0 +1,279 @@
+# supervisor.py
+"""Многопроцессный режим вебхук-сервера (WEB_WORKERS > 1).
+
+Supervisor запускает WEB_WORKERS процессов `python bot.py` с WORKER_INDEX.
+Все воркеры слушают PORT через SO_REUSEPORT, ядро раздаёт им соединения
+как попало, поэтому каждый воркер — ещё и диспетчер: апдейт пользователя
+обрабатывает воркер user_id % WEB_WORKERS (WorkerRouter.owner), чужие
+апдейты пересылаются владельцу через его unix-сокет. Так состояние
+пользователя (FSM-кеш, очередь анкет, лимиты) живёт в одном процессе, а
+пропускная способность растёт с числом ядер.
+
+Фоновые задачи в одном экземпляре (ночная чистка, возобновление рассылок,
+установка вебхука) выполняет воркер 0. GET /health и /metrics, попавшие
+в любой воркер, собирают ответы всех (/health/worker, /metrics/worker —
+только своего процесса); у метрик появляется метка worker.
+
+Supervisor раз в WORKER_HEALTH_SEC опрашивает /health/worker каждого
+воркера и перезапускает упавшие и зависшие. SIGHUP — поочерёдный
+перезапуск (остальные воркеры продолжают работу, апдейты для
+перезапускаемого получают 503 и повторяются Telegram), SIGTERM/SIGINT —
+остановка с дообработкой принятых апдейтов.
+
+    WEB_WORKERS=4 python bot.py      # или python supervisor.py
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from config import (WEB_WORKERS, WORKER_SOCKET_DIR, WORKER_HEALTH_SEC, WORKER_HEALTH_FAILS,
+                    WORKER_STOP_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+FORWARDED = "X-Worker-Forwarded"  # пересланный апдейт обрабатывается на месте, без повторной маршрутизации
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+def socket_path(port: int, index: int) -> str:
+    return os.path.join(WORKER_SOCKET_DIR, f"tgbot-{port}-{index}.sock")
+
+
+class WorkerRouter:
+    """Маршрутизация апдейтов между воркерами (живёт в каждом воркере)"""
+
+    def __init__(self, index: int, count: int, port: int):
+        self.index = index
+        self.count = count
+        self.port = port
+        self.forwarded = 0
+        self._sessions: Dict[int, aiohttp.ClientSession] = {}
+
+    def owner(self, key: int) -> int:
+        return key % self.count
+
+    def _session(self, index: int) -> aiohttp.ClientSession:
+        session = self._sessions.get(index)
+        if session is None or session.closed:
+            connector = aiohttp.UnixConnector(path=socket_path(self.port, index))
+            session = self._sessions[index] = aiohttp.ClientSession(connector=connector)
+        return session
+
+    async def forward(self, index: int, body: bytes, headers: dict) -> tuple:
+        """Пересылает апдейт воркеру index; (статус, тело, content-type) его ответа.
+        Воркер недоступен (перезапускается) — 503, Telegram повторит апдейт."""
+        self.forwarded += 1
+        try:
+            async with self._session(index).post("http://worker/api/webhook", data=body,
+                                                 headers={**headers, FORWARDED: "1"}) as resp:
+                return resp.status, await resp.read(), resp.content_type
+        except (aiohttp.ClientError, OSError) as e:
+            logger.warning(f"worker {index} unavailable: {e!r}")
+            return 503, b"", None
+
+    async def _collect(self, path: str, local, read, headers: Optional[dict] = None) -> list:
+        """GET path у всех воркеров по порядку: свой ответ — local, у недоступного — исключение"""
+        async def one(index):
+            if index == self.index:
+                return local
+            try:
+                async with self._session(index).get(f"http://worker{path}", headers=headers,
+                                                    timeout=aiohttp.ClientTimeout(total=2)) as resp:
+                    resp.raise_for_status()
+                    return await read(resp)
+            except Exception as e:
+                return e
+        return list(await asyncio.gather(*(one(i) for i in range(self.count))))
+
+    async def health_all(self, local: dict) -> List[dict]:
+        """Состояние всех воркеров: своё — local, остальные опрашиваются"""
+        results = await self._collect("/health/worker", local, lambda resp: resp.json())
+        return [{"worker": i, "ok": False, "error": repr(r)} if isinstance(r, Exception) else r
+                for i, r in enumerate(results)]
+
+    async def metrics_all(self, local: bytes, headers: Optional[dict] = None) -> Dict[int, bytes]:
+        """Метрики всех воркеров (текст Prometheus) по индексу; недоступные пропускаются"""
+        results = await self._collect("/metrics/worker", local, lambda resp: resp.read(), headers)
+        parts = {}
+        for i, r in enumerate(results):
+            if isinstance(r, Exception):
+                logger.warning(f"worker {i} metrics unavailable: {r!r}")
+            else:
+                parts[i] = r
+        return parts
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+
+def run_worker(app, port: int, index: int, shutdown_timeout: float = WORKER_STOP_TIMEOUT):
+    """Точка входа процесса-воркера: общий TCP-порт (SO_REUSEPORT) и свой unix-сокет"""
+    from aiohttp import web
+
+    path = socket_path(port, index)
+    if os.path.exists(path):
+        os.unlink(path)  # остался от упавшего предшественника
+    web.run_app(app, host="0.0.0.0", port=port, path=path, reuse_port=True,
+                shutdown_timeout=shutdown_timeout, print=None)
+
+
+class _Worker:
+    __slots__ = ("index", "proc", "started", "fails", "restarts")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.started = 0.0
+        self.fails = 0
+        self.restarts = 0
+
+
+class Supervisor:
+    def __init__(self, workers: int = WEB_WORKERS, port: int = 8080,
+                 health_sec: float = WORKER_HEALTH_SEC, stop_timeout: float = WORKER_STOP_TIMEOUT):
+        self.port = port
+        self.health_sec = health_sec
+        self.stop_timeout = stop_timeout
+        self.workers = [_Worker(i) for i in range(workers)]
+        self._stop = asyncio.Event()
+        self._restarting = False
+        self._pending: Dict[int, asyncio.Task] = {}  # индекс воркера -> его отложенный перезапуск
+
+    async def _spawn(self, w: _Worker):
+        env = dict(os.environ, WORKER_INDEX=str(w.index), WEB_WORKERS=str(len(self.workers)), PORT=str(self.port))
+        w.proc = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=env)
+        w.started = time.monotonic()
+        w.fails = 0
+        logger.info(f"👷 Воркер {w.index} запущен (pid {w.proc.pid})")
+
+    async def _terminate(self, w: _Worker):
+        proc = w.proc
+        if proc is None or proc.returncode is not None:
+            return
+        proc.terminate()
+        try:
+            await asyncio.wait_for(proc.wait(), self.stop_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Воркер {w.index} не остановился за {self.stop_timeout} с, kill")
+            proc.kill()
+            await proc.wait()
+
+    async def _health(self, w: _Worker) -> bool:
+        connector = aiohttp.UnixConnector(path=socket_path(self.port, w.index))
+        try:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                async with session.get("http://worker/health/worker",
+                                       timeout=aiohttp.ClientTimeout(total=self.health_sec / 2)) as resp:
+                    return resp.status == 200
+        except Exception:
+            return False
+
+    async def _wait_ready(self, w: _Worker, timeout: float = 60) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and w.proc.returncode is None:
+            if await self._health(w):
+                return True
+            await asyncio.sleep(0.5)
+        return False
+
+    def _schedule_restart(self, w: _Worker, delay: float = 0.0, terminate: bool = False):
+        """Перезапуск воркера отдельной задачей: пока один ждёт паузу или остановки,
+        _watch продолжает следить за остальными"""
+        task = asyncio.create_task(self._restart(w, delay, terminate))
+        self._pending[w.index] = task
+        task.add_done_callback(lambda _: self._pending.pop(w.index, None))
+
+    async def _restart(self, w: _Worker, delay: float, terminate: bool):
+        if terminate:
+            await self._terminate(w)
+        if delay:
+            try:
+                await asyncio.wait_for(self._stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        if self._stop.is_set():
+            return
+        await self._spawn(w)
+        w.restarts += 1
+
+    async def _cancel_pending(self):
+        tasks = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def rolling_restart(self):
+        """Перезапуск по одному: следующий воркер останавливается, когда новый ответил на /health"""
+        if self._restarting:
+            return
+        self._restarting = True
+        try:
+            # отложенные перезапуски не нужны: ниже перезапускаются все
+            await self._cancel_pending()
+            for w in self.workers:
+                if self._stop.is_set():
+                    break
+                await self._terminate(w)
+                await self._spawn(w)
+                w.restarts += 1
+                if not await self._wait_ready(w):
+                    logger.error(f"❌ Воркер {w.index} не поднялся после перезапуска")
+            logger.info("🔄 Воркеры перезапущены")
+        finally:
+            self._restarting = False
+
+    async def _watch(self):
+        """Перезапуск упавших и не отвечающих воркеров"""
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.health_sec)
+            except asyncio.TimeoutError:
+                pass
+            if self._stop.is_set() or self._restarting:
+                continue
+            for w in self.workers:
+                if w.index in self._pending:
+                    continue  # уже перезапускается
+                if w.proc.returncode is not None:
+                    # падение сразу после старта — не крутим перезапуски чаще раза в несколько секунд
+                    delay = min(30.0, 2 ** min(w.restarts, 5)) if time.monotonic() - w.started < 10 else 0
+                    logger.error(f"❌ Воркер {w.index} завершился с кодом {w.proc.returncode}, перезапуск через {delay} с")
+                    self._schedule_restart(w, delay)
+                    continue
+                if time.monotonic() - w.started < self.health_sec * WORKER_HEALTH_FAILS:
+                    continue  # ещё стартует
+                if await self._health(w):
+                    w.fails = 0
+                    continue
+                w.fails += 1
+                logger.warning(f"⚠️ Воркер {w.index} не ответил на /health ({w.fails}/{WORKER_HEALTH_FAILS})")
+                if w.fails >= WORKER_HEALTH_FAILS:
+                    self._schedule_restart(w, terminate=True)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self._stop.set)
+        loop.add_signal_handler(signal.SIGINT, self._stop.set)
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.rolling_restart()))
+        for w in self.workers:
+            await self._spawn(w)
+        logger.info(f"✅ Supervisor: {len(self.workers)} воркеров на порту {self.port}")
+        await self._watch()
+        logger.info("🔌 Остановка воркеров")
+        await self._cancel_pending()
+        await asyncio.gather(*(self._terminate(w) for w in self.workers))
+
+
+if __name__ == "__main__":
+    # то же, что WEB_WORKERS=N python bot.py, но без загрузки бота в процесс supervisor
+    from config import PORT
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(Supervisor(WEB_WORKERS, PORT).run())
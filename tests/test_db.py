@@ -0,0 +1,35 @@
+# tests/test_db.py
+import asyncio
+
+import db
+
+
+class FakeConn:
+    def __init__(self):
+        self.calls = []
+
+    async def prepare(self, query):
+        self.calls.append(("prepare", query))
+
+    async def execute(self, query):
+        self.calls.append(("execute", query))
+
+
+class CachingConn(FakeConn):
+    async def _get_statement(self, query, timeout):
+        self.calls.append(("cache", query))
+
+
+def test_warm_fills_statement_cache(monkeypatch):
+    monkeypatch.setattr(db, "STATEMENT_CACHE", 100)
+    conn = CachingConn()
+    asyncio.run(db._warm(conn))
+    assert conn.calls == [("cache", q) for q in db.WARMUP] + [("execute", "SELECT 1")]
+
+
+def test_warm_falls_back_to_prepare(monkeypatch):
+    # закрытого _get_statement в другой версии asyncpg может не быть
+    monkeypatch.setattr(db, "STATEMENT_CACHE", 100)
+    conn = FakeConn()
+    asyncio.run(db._warm(conn))
+    assert conn.calls == [("prepare", q) for q in db.WARMUP] + [("execute", "SELECT 1")]
@@ -0,0 +1,86 @@
+# tests/test_handlers.py
+import asyncio
+
+import handlers
+from handlers import CAPTION_LIMIT, match_caption
+
+
+def profile(bio: str, **extra) -> dict:
+    return {"user_id": 2, "name": "Аня", "age": 25, "bio": bio, "photo_id": None, **extra}
+
+
+def test_match_caption_short_is_unchanged():
+    assert match_caption(profile("люблю горы")) == "Имя: Аня\nВозраст: 25\nО себе: люблю горы"
+
+
+def test_match_caption_is_cut_to_photo_caption_limit():
+    caption = match_caption(profile("я" * 5000))
+    assert len(caption) == CAPTION_LIMIT
+    assert caption.startswith("Имя: Аня\nВозраст: 25\nО себе: я")
+
+
+class FakeDB:
+    def __init__(self, row):
+        self.row = row
+
+    async def get_next_profile(self, viewer):
+        return self.row
+
+
+def test_card_caption_is_cut_to_photo_caption_limit(monkeypatch):
+    # DESC_LIMIT больше лимита подписи: без обрезки send_photo/edit_media падают
+    monkeypatch.setattr(handlers, "db", FakeDB(profile("я" * 5000, photo_id="p", superlike_ok=True)))
+    row, caption, kb = asyncio.run(handlers.next_card(1))
+    assert len(caption) == CAPTION_LIMIT
+    assert any(b.callback_data == "superlike:2" for line in kb.inline_keyboard for b in line)
+
+
+def test_card_without_superlike_has_no_button(monkeypatch):
+    monkeypatch.setattr(handlers, "db", FakeDB(profile("коротко", superlike_ok=False)))
+    _, caption, kb = asyncio.run(handlers.next_card(1))
+    assert caption == "Аня, 25\n\nкоротко"
+    assert not any(b.callback_data.startswith("superlike:") for line in kb.inline_keyboard for b in line)
+
+
+def test_api_group_runs_last_call_in_update_task():
+    # ReplyCollector отдаёт телом ответа на вебхук только вызовы из задачи апдейта
+    async def call(name, tasks):
+        tasks[name] = asyncio.current_task()
+        if name == "fail":
+            raise RuntimeError(name)
+        return name
+
+    async def main():
+        tasks = {}
+        single = await handlers.api_group(call("only", tasks))
+        assert single == ["only"] and tasks["only"] is asyncio.current_task()
+        results = await handlers.api_group(call("fail", tasks), call("send", tasks))
+        assert tasks["send"] is asyncio.current_task()
+        assert tasks["fail"] is not asyncio.current_task()
+        return results
+
+    first, last = asyncio.run(main())
+    assert isinstance(first, RuntimeError) and last == "send"
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        self.sent.append(("photo", chat_id, photo))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(("text", chat_id, text))
+
+
+def test_show_card_over_inaccessible_message_sends_new_card(monkeypatch):
+    # кнопка под сообщением старше 48 часов: ни править, ни удалять его нельзя
+    from aiogram.types import Chat, InaccessibleMessage
+
+    bot = FakeBot()
+    monkeypatch.setattr(handlers, "bot_instance", bot)
+    current = InaccessibleMessage(chat=Chat(id=1, type="private"), message_id=7)
+    card = (profile("коротко", photo_id="p"), "Аня, 25", None)
+    asyncio.run(handlers.show_card(1, card, current))
+    assert bot.sent == [("photo", 1, "p")]
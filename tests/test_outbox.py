@@ -0,0 +1,89 @@
+# tests/test_outbox.py
+import json
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from outbox import OutboxDispatcher, MAX_BACKOFF
+
+MAX_ATTEMPTS = 3
+method = SendMessage(chat_id=1, text="x")  # для конструкторов исключений aiogram
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+        self.completed = None
+
+    async def outbox_claim(self, limit, lease_sec):
+        rows, self.rows = self.rows[:limit], self.rows[limit:]
+        return rows
+
+    async def outbox_complete(self, done, retry, dead):
+        self.completed = (sorted(done), sorted(retry), sorted(dead))
+
+
+class FakeBot:
+    """send_message по chat_id: исключение из errors или успех"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        error = self.errors.get(chat_id)
+        if error:
+            raise error
+        self.sent.append(chat_id)
+
+
+def row(id_, attempts=0, kind="match"):
+    payload = json.dumps({"match_id": id_, "name": "ann"})
+    return {"id": id_, "chat_id": id_, "kind": kind, "payload": payload, "attempts": attempts}
+
+
+def drain(rows, errors):
+    db = FakeDB(rows)
+    bot = FakeBot(errors)
+    n = asyncio.run(OutboxDispatcher(db, bot, max_attempts=MAX_ATTEMPTS).drain_once())
+    assert n == len(rows)
+    return db.completed, bot.sent
+
+
+def test_delivered_rows_are_done():
+    (done, retry, dead), sent = drain([row(1), row(2, kind="superlike")], {})
+    assert done == [1, 2] and retry == [] and dead == []
+    assert sorted(sent) == [1, 2]
+
+
+def test_error_is_retried_with_backoff_and_counted():
+    (done, retry, dead), _ = drain([row(1, attempts=0), row(2, attempts=1)],
+                                   {1: RuntimeError("boom"), 2: RuntimeError("boom")})
+    assert done == [] and dead == []
+    assert retry == [(1, 1, "boom", 1), (2, 2, "boom", 1)]
+
+
+def test_backoff_is_capped():
+    db, bot = FakeDB([row(1, attempts=30)]), FakeBot({1: RuntimeError("boom")})
+    asyncio.run(OutboxDispatcher(db, bot, max_attempts=100).drain_once())
+    assert db.completed[1] == [(1, MAX_BACKOFF, "boom", 1)]
+
+
+def test_last_attempt_goes_dead():
+    (done, retry, dead), _ = drain([row(1, attempts=MAX_ATTEMPTS - 1)], {1: RuntimeError("boom")})
+    assert retry == [] and dead == [(1, "boom")]
+
+
+def test_permanent_errors_go_dead_at_once():
+    forbidden = TelegramForbiddenError(method=method, message="bot was blocked by the user")
+    (done, retry, dead), _ = drain([row(1), row(2, kind="unknown")], {1: forbidden})
+    assert retry == [] and [d[0] for d in dead] == [1, 2]
+
+
+def test_flood_wait_never_uses_attempts_or_dead_letters():
+    flood = TelegramRetryAfter(method=method, message="flood", retry_after=7)
+    (done, retry, dead), _ = drain([row(1, attempts=0), row(2, attempts=MAX_ATTEMPTS - 1)],
+                                   {1: flood, 2: flood})
+    assert dead == []
+    assert [(r[0], r[1], r[3]) for r in retry] == [(1, 7, 0), (2, 7, 0)]
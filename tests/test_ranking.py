@@ -0,0 +1,69 @@
+# tests/test_ranking.py
+import numpy as np
+import pytest
+
+from ranking import RankingEngine
+
+NOW = 1_700_000_000.0
+
+
+def engine(n: int, seed: int = 1) -> RankingEngine:
+    """Пул из n анкет с id 1..n, разным возрастом, активностью и лайками"""
+    ranking = RankingEngine(db=None, seed=seed)
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, n + 1)
+    ranking.pool.load(ids, rng.integers(18, 60, n), NOW - rng.uniform(0, 30 * 86400, n),
+                      rng.integers(0, 50, n))
+    ranking._refresh_base(NOW)
+    return ranking
+
+
+def check(picked, n: int, exclude, limit: int):
+    picked = picked.tolist()
+    assert len(picked) == len(set(picked)), "повторы в выдаче"
+    assert not set(picked) & set(exclude), "исключённые в выдаче"
+    assert set(picked) <= set(range(1, n + 1))
+    assert len(picked) == min(limit, n - len(set(exclude) & set(range(1, n + 1))))
+
+
+@pytest.mark.parametrize("limit", [1, 10, 50])
+def test_sample_without_duplicates_or_excluded(limit):
+    ranking = engine(200)
+    exclude = list(range(1, 200, 3)) + [10_000]  # в том числе id не из пула
+    for seed in range(20):
+        ranking._rng = np.random.default_rng(seed)
+        check(ranking.rank(25, exclude, likers=[2, 5], limit=limit, now=NOW), 200, exclude, limit)
+
+
+def test_limit_close_to_pool_size_takes_exact_path():
+    # почти все слоты нужны: бросков по накопленной сумме не хватает, остаток добирается точно
+    ranking = engine(30)
+    exclude = [1, 2, 3, 3]
+    for seed in range(20):
+        ranking._rng = np.random.default_rng(seed)
+        check(ranking.rank(30, exclude, likers=[], limit=100, now=NOW), 30, exclude, 100)
+
+
+def test_dominant_weight_does_not_repeat():
+    ranking = engine(50)
+    likers = [7]
+    ranking.pool.base[:50] = 1e-6  # лайкнувший зрителя весит в миллионы раз больше остальных
+    picked = ranking.rank(None, [], likers, limit=10, now=NOW)
+    check(picked, 50, [], 10)
+    assert 7 in picked.tolist()
+
+
+def test_everyone_excluded_returns_empty():
+    ranking = engine(5)
+    assert len(ranking.rank(30, [1, 2, 3, 4, 5], likers=[], limit=3, now=NOW)) == 0
+
+
+def test_removed_user_is_never_sampled():
+    ranking = engine(20)
+    ranking.remove(4)
+    ranking.remove(20)  # последний слот — удаление без перестановки
+    assert 4 not in ranking.pool and 20 not in ranking.pool
+    for seed in range(20):
+        ranking._rng = np.random.default_rng(seed)
+        picked = ranking.rank(30, [], likers=[], limit=18, now=NOW).tolist()
+        assert sorted(picked) == [i for i in range(1, 20) if i != 4]
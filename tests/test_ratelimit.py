@@ -0,0 +1,51 @@
+# tests/test_ratelimit.py
+from ratelimit import GCRALimiter
+
+
+def test_burst_up_to_limit_then_denied():
+    limiter = GCRALimiter(limit=5, period=10)
+    assert [limiter.hit("u", now=0)[0] for _ in range(5)] == [True] * 5
+    # первый отказ серии — с предупреждением, следующие молча
+    assert limiter.hit("u", now=0) == (False, True)
+    assert limiter.hit("u", now=0) == (False, False)
+
+
+def test_refill_one_event_per_interval():
+    limiter = GCRALimiter(limit=5, period=10)
+    for _ in range(5):
+        limiter.hit("u", now=0)
+    assert not limiter.hit("u", now=1.9)[0]
+    assert limiter.hit("u", now=2) == (True, False)
+    # разрешение закрыло серию отказов: новая начинается с предупреждения
+    assert limiter.hit("u", now=2) == (False, True)
+    assert limiter.hit("u", now=2.5) == (False, False)
+
+
+def test_full_burst_after_idle_period():
+    limiter = GCRALimiter(limit=5, period=10)
+    for _ in range(6):
+        limiter.hit("u", now=0)
+    assert [limiter.hit("u", now=10)[0] for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_keys_are_independent():
+    limiter = GCRALimiter(limit=1, period=10)
+    assert limiter.hit("a", now=0)[0]
+    assert not limiter.hit("a", now=0)[0]
+    assert limiter.hit("b", now=0)[0]
+
+
+def test_idle_keys_are_evicted():
+    limiter = GCRALimiter(limit=5, period=10)
+    for i in range(100):
+        limiter.hit(("old", i), now=0)
+    for i in range(60):
+        limiter.hit(("new", i), now=1000)
+    assert len(limiter) == 60
+
+
+def test_max_keys_bounds_memory():
+    limiter = GCRALimiter(limit=5, period=10, max_keys=10)
+    for i in range(100):
+        limiter.hit(i, now=0)
+    assert len(limiter) <= 11
@@ -0,0 +1,116 @@
+# webhook_reply.py
+"""Ответ на вебхук вызовом Bot API.
+
+Telegram выполняет метод, возвращённый в теле ответа на вебхук, — это на
+один исходящий HTTPS-запрос меньше. ReplyCollector (middleware сессии бота)
+придерживает подходящий вызов апдейта (INLINE_METHODS), а хендлер сразу
+получает заглушку результата. Если за ним следует ещё вызов, придержанный
+сначала уходит обычным путём, так что порядок сообщений не меняется. Что
+осталось придержанным к концу апдейта, становится телом ответа.
+
+Цена: результат придержанного вызова хендлеру недоступен (message_id = 0),
+а ошибка выполнения из ответа вебхука не видна. Хендлеры не используют
+ни того ни другого. Включается WEBHOOK_REPLY, не работает с WEBHOOK_FAST_ACK
+(там ответ уходит до обработки).
+"""
+import json
+import asyncio
+import datetime
+import logging
+import contextvars
+from typing import Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Chat, Message
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INLINE_METHODS = {"sendMessage", "sendPhoto", "answerCallbackQuery", "deleteMessage"}
+
+_current = contextvars.ContextVar("webhook_reply", default=None)
+
+
+class WebhookReply:
+    """Один апдейт: async with WebhookReply() as reply: ...; потом reply.body()"""
+
+    def __init__(self):
+        self.payload = None  # придержанный вызов: поля формы Bot API с "method"
+        self._held = None    # (make_request, bot, method) для отправки обычным путём
+        self._task = None
+        self._token = None
+
+    async def __aenter__(self):
+        # вызовы из задач, порождённых хендлером (рассылка и т.п.), не перехватываются
+        self._task = asyncio.current_task()
+        self._token = _current.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self._task = None
+        if exc_type is not None:
+            # ответ будет 500 — придержанное отправляем сами, чтобы оно не пропало
+            await self.release()
+
+    def active(self) -> bool:
+        return self._task is not None and asyncio.current_task() is self._task
+
+    def hold(self, make_request, bot, method) -> bool:
+        name = method.__api_method__
+        if name not in INLINE_METHODS:
+            return False
+        if name in ("sendMessage", "sendPhoto") and not isinstance(method.chat_id, int):
+            return False
+        files = {}
+        payload = {"method": name}
+        for key, value in method.model_dump(warnings=False).items():
+            value = bot.session.prepare_value(value, bot=bot, files=files)
+            if value is not None:
+                payload[key] = value
+        if files:
+            # загрузку файла в ответе вебхука не передать
+            return False
+        self.payload = payload
+        self._held = (make_request, bot, method)
+        return True
+
+    async def release(self):
+        """Отправляет придержанный вызов обычным путём"""
+        if self._held is None:
+            return
+        make_request, bot, method = self._held
+        self._held = self.payload = None
+        try:
+            await make_request(bot, method)
+        except Exception:
+            logger.exception(f"held {method.__api_method__} failed")
+
+    def body(self) -> Optional[bytes]:
+        """Тело ответа на вебхук (JSON) или None, если отвечать нечем"""
+        if self.payload is None:
+            return None
+        metrics.API_INLINED.labels(self.payload["method"]).inc()
+        self._held = None
+        return json.dumps(self.payload, ensure_ascii=False).encode()
+
+
+def _stub(method):
+    if method.__api_method__ in ("sendMessage", "sendPhoto"):
+        return Message(message_id=0, date=datetime.datetime.now(datetime.UTC),
+                       chat=Chat(id=method.chat_id, type="private"))
+    return True
+
+
+class ReplyCollector(BaseRequestMiddleware):
+    """Middleware сессии бота: регистрировать первым, чтобы метрики видели только настоящие запросы"""
+
+    async def __call__(self, make_request, bot, method):
+        reply = _current.get()
+        if reply is None or not reply.active():
+            return await make_request(bot, method)
+        await reply.release()
+        if reply.hold(make_request, bot, method):
+            return _stub(method)
+        return await make_request(bot, method)